@@ -0,0 +1,38 @@
+#! /usr/bin/env python
+'''
+Regression benchmark of the patternMatch output accumulator.
+
+Feed a large synthetic output, splitted into pages by a --More-- pager, through the mock
+simulator and measure the time spent by patternMatch to collect it: the time must grow
+linearly with the output size.
+
+usage: bench_accumulator.py [megabytes] [pages]
+
+@author: adona
+'''
+import sys
+import time
+import logging
+
+from pyco.test.mock.test_accumulator_mock import paged_device
+
+def main(megabytes=50, pages=1000):
+    # the debug log of every page would dominate the measure
+    logging.disable(logging.INFO)
+
+    pageSize = megabytes * 1024 * 1024 // pages
+    line = 'interface GigabitEthernet0/0/0.%d\r\n'
+    for size in (megabytes // 4, megabytes // 2, megabytes):
+        npages = max(1, pages * size // megabytes)
+        chunk = (line * (pageSize // len(line)))[:pageSize]
+        h = paged_device([chunk] * npages)
+
+        start = time.time()
+        out = h.esession.processResponse(h, lambda d: d.currentEvent.name == 'prompt-match')
+        elapsed = time.time() - start
+
+        assert len(out) == npages * len(chunk) + (npages - 1) * len('--More--')
+        print('%4d MB, %5d pages: %7.3f s (%6.1f MB/s)' % (size, npages, elapsed, len(out) / elapsed / 1024 / 1024))
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
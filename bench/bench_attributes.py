@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+'''
+Micro-benchmark of the device attribute resolution on a three levels driver hierarchy.
+
+Compare the flattened driver settings, a single dictionary lookup, with the walk of the parent
+drivers done by the previous Driver.__getattr__, for an inherited attribute and for a missing one.
+
+usage: bench_attributes.py [repeat]
+
+@author: adona
+'''
+import sys
+import timeit
+
+from pyco.device import device, Driver, driverBuilder
+
+
+class WalkingDriver:
+    '''
+    The previous driver lookup: every level missing the attribute delegates to its parent
+    '''
+    def __init__(self, driver, parent):
+        self.__dict__.update(dict([(k, v) for (k, v) in driver.__dict__.items() if k != 'settings']))
+        self.parentDriver = parent
+
+    def __getattr__(self, attrname):
+        if attrname in ('parent', 'parentDriver') or self.parentDriver is None:
+            raise AttributeError(attrname)
+        try:
+            return getattr(self.parentDriver, attrname)
+        except AttributeError:
+            raise AttributeError(attrname)
+
+
+class WalkingDevice:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __getattr__(self, attrname):
+        if attrname == 'driver':
+            raise AttributeError(attrname)
+        try:
+            return getattr(self.driver, attrname)
+        except AttributeError:
+            raise AttributeError(attrname)
+
+
+def main(repeat=200000):
+    # common <- linux <- benchlinux
+    if 'benchlinux' not in Driver.registry:
+        driverBuilder('benchlinux').parent = 'linux'
+
+    h = device('ssh://u:p@localhost/benchlinux')
+
+    common = WalkingDriver(Driver.get('common'), None)
+    linux = WalkingDriver(Driver.get('linux'), common)
+    walking = WalkingDevice(WalkingDriver(Driver.get('benchlinux'), linux))
+
+    print('%d lookups' % repeat)
+    for (name, target) in [('walk', walking), ('flattened', h)]:
+        assert target.maxWait == Driver.get('common').maxWait
+        inherited = timeit.timeit(lambda: target.maxWait, number=repeat)
+        missing = timeit.timeit(lambda: hasattr(target, 'undefinedAttribute'), number=repeat)
+        print('%-10s inherited %6.3f us/lookup   missing %6.3f us/lookup' %
+              (name, inherited * 1e6 / repeat, missing * 1e6 / repeat))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,56 @@
+#! /usr/bin/env python
+'''
+Micro-benchmark of the pattern matchers over the device outputs recorded into sim/data.
+
+Compare the pexpect searcher_re, that scans the buffer once for every pattern, with the
+AlternationSearcher, that scans the buffer once for all the patterns of the state.
+
+usage: PYCO_HOME=<pyco source root> bench_matcher.py [repeat]
+
+PYCO_HOME must contain the handlers.py module used by the ciscoios driver.
+
+@author: adona
+'''
+import os
+import sys
+import timeit
+
+from pexpect import TIMEOUT #@UnresolvedImport
+from pexpect.expect import searcher_re #@UnresolvedImport
+
+from pyco.device import device
+from pyco.matcher import AlternationSearcher
+
+SIM_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sim', 'data')
+
+def sim_outputs():
+    outputs = []
+    for (root, dirs, files) in os.walk(SIM_DATA):
+        for name in sorted(files):
+            with open(os.path.join(root, name), encoding='utf-8', errors='replace') as f:
+                outputs.append(f.read().replace('\n', '\r\n'))
+    return outputs
+
+def main(repeat=20):
+    h = device('telnet://u:p@r-bo093/ciscoios')
+    h.add_expect_pattern('prompt-match', 'r-bo093#', 'USER_PROMPT')
+    (patterns, compiled) = h.pattern_table('USER_PROMPT', [TIMEOUT])
+    events = [h.patternMap.get('USER_PROMPT', {}).get(p, h.patternMap['*'].get(p)) for p in patterns]
+
+    listSearcher = searcher_re(compiled)
+    alternation = AlternationSearcher(patterns, events)
+
+    # a large show output with the prompt at the end
+    buffer = ''.join(sim_outputs()) * 50 + 'r-bo093#'
+
+    print('%d patterns, %d chars buffer' % (len(patterns) - 1, len(buffer)))
+    for (name, searcher) in [('searcher_re', listSearcher), ('alternation', alternation)]:
+        assert searcher.search(buffer, len(buffer)) == patterns.index('r-bo093#')
+        elapsed = timeit.timeit(lambda: searcher.search(buffer, len(buffer)), number=repeat)
+        print('%-12s %8.3f ms/search' % (name, elapsed * 1000 / repeat))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
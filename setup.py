@@ -7,7 +7,8 @@ import sys
 from setuptools import setup, find_packages
 
 if sys.platform != 'win32':
-    expect = 'pexpect>=2.4'
+    # ExpectSession.read_lines uses the buffers of the pexpect 4 spawn classes
+    expect = 'pexpect>=4.0,<5'
 else:
     expect = 'winpexpect'
 
@@ -35,6 +36,9 @@ setup(name='pyco',
       entry_points="""
         [pyco.plugin]
             auth=pyco.device:getAccount
+
+        [console_scripts]
+            pyco-cache=pyco.cachetool:main
         """
 
 
@@ -0,0 +1,47 @@
+'''
+Export and import the prompt cache.
+
+usage: pyco-cache [--db URL] export FILE
+       pyco-cache [--db URL] import FILE
+
+The FILE is a json list ``[device, state, prompt]`` for every line, gzip compressed if FILE ends with ``.gz``:
+export the prompts discovered by a node and import them into the cache of a new node, so that its first poll
+skips the prompt discovery.
+
+The cache database is the one configured by the pyco configuration file, unless --db is given.
+
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import sys
+import argparse
+
+import pyco.device
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pyco-cache', description='export and import the pyco prompt cache')
+    parser.add_argument('--db', help='the sqlalchemy url of the cache database, for example sqlite:////tmp/cache.sqlite')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('file')
+    args = parser.parse_args(argv)
+
+    if not pyco.device.sql_powered:
+        parser.error('the prompt cache needs the sqlalchemy, zope.sqlalchemy and transaction packages')
+    if args.db:
+        pyco.device.open_cache(args.db)
+    elif not pyco.device.cache_enabled():
+        parser.error('the prompt cache is not configured: set the cache parameter or use --db')
+
+    if args.command == 'export':
+        count = pyco.device.export_prompts(args.file)
+        print('%d prompts exported to %s' % (count, args.file))
+    else:
+        count = pyco.device.import_prompts(args.file)
+        print('%d prompts imported from %s' % (count, args.file))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
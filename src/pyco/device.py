@@ -8,29 +8,47 @@ import sys
 import os
 import re
 import time
-from mako.template import Template
-from mako.runtime import Context
-from io import StringIO
-from validate import Validator
-from pkg_resources import resource_filename, resource_string, iter_entry_points #@UnresolvedImport
+import uuid
+import subprocess
+import hashlib
+import marshal
+import tempfile
+import threading
+import importlib.util
+from types import MappingProxyType
 
 import pyco.log
 
 # create logger
 log = pyco.log.getLogger("device")
 
-from configobj import ConfigObj, flatten_errors #@UnresolvedImport
+from pyco.promptcache import PromptCache
+from pyco import plugins
+
+# the configuration files shipped with pyco
+cfgDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cfg')
+specFile = os.path.join(cfgDir, 'pyco_spec.cfg')
 
 expectLogfile = '/tmp/expect.log'
-cfgFile = resource_filename('pyco', 'cfg/pyco.cfg')
+cfgFile = os.path.join(cfgDir, 'pyco.cfg')
 if hasattr(pyco, 'pyco_home'):
     expectLogfile = pyco.pyco_home + "/logs/expect.log"
     if (os.path.isfile(pyco.pyco_home + "/cfg/pyco.cfg")):
         cfgFile = pyco.pyco_home + "/cfg/pyco.cfg"
 
+# the compiled snapshots of the validated configuration files, saved only if PYCO_SNAPSHOTS is set
+snapshotDir = os.path.join(pyco.pyco_home, '.pyco', 'snapshots')
+snapshotsEnabled = os.environ.get('PYCO_SNAPSHOTS', '0') not in ('', '0')
+
+# the control path of the ssh master connections --> the time the connection was last known alive
+sshMasters = {}
+
 # the shared configObj
 configObj = None
 
+# matches all the output already arrived, used for clearing the expect buffer
+ANY_OUTPUT = re.compile('.*', re.DOTALL)
+
 class DeviceException(Exception):
 
     """This is the Device base exception class."""
@@ -62,8 +80,11 @@ class ExpectException(DeviceException):
     # impossibile connettersi correttamente all'apparato di rete
     code = 310
     
+    # the size of the interaction log tail kept for diagnostics
+    tailSize = 8192
+    
     def __init__(self, device, msg=''):
-        self.interaction_log = device.interaction_log()
+        self.interaction_log = device.interaction_log(tail=self.tailSize)
         DeviceException.__init__(self, device, msg)
 
     def descr(self):
@@ -142,7 +163,7 @@ def path(hops):
     target.hops = hops
     return target
 
-def device(url):
+def device(url, deviceClass=None):
     '''
     Returns a Device instance builded from a url.
 
@@ -233,7 +254,28 @@ def device(url):
       Traceback (most recent call last):
         ...
       DriverNotFound: 'zdriver driver not defined'
+
+    *deviceClass* is the class of the returned object, it defaults to :py:class:`pyco.device.Device`.
         
+    '''
+    (driverName, host, user, password, protocol, port) = urlItems(url)
+    
+    driver = Driver.get(driverName)
+    
+    if deviceClass is None:
+        deviceClass = Device
+    
+    obj = deviceClass(host, driver, user, password, protocol, port)
+    log.debug("[%s] builded" % host)
+    return obj
+
+def urlItems(url):
+    '''
+    Return the (driver, host, user, password, protocol, port) tuple of the device url, with the default values
+    for the missing items::
+    
+      >>> urlItems('jack:secret@myhost')
+      ('common', 'myhost', 'jack', 'secret', 'ssh', 22)
     '''
     if url.startswith('telnet://') or url.startswith('ssh://'):
         pass
@@ -262,11 +304,18 @@ def device(url):
     if driverName == '':
         driverName = 'common'
     
-    driver = Driver.get(driverName)
+    return (driverName, host, user, password, protocol, port)
+
+def async_device(url):
+    '''
+    Returns an :py:class:`pyco.device.AsyncDevice` instance builded from a url.
     
-    obj = Device(host, driver, user, password, protocol, port)
-    log.debug("[%s] builded" % host)
-    return obj
+    The url syntax is the same of :py:func:`pyco.device.device`::
+    
+      h = async_device('telnet://u:p@myhost/ciscoios')
+      out = await h.send('show version')
+    '''
+    return device(url, AsyncDevice)
     
 def parseUrl(url):
     '''
@@ -312,6 +361,58 @@ def defaultEventHandler(device):
         device.close()
         raise exception
 
+# the completion markers printed by the markerCommand, matched as an extra pattern of processResponse
+markerPattern = '__pyco_[0-9a-f]{12}__'
+
+def runUntilOutputCompleteOrTimeout(device):
+    '''
+    The checkpoint of the commands completed by a marker: the device printed the marker or timed out
+    '''
+    return device.currentEvent.name == 'timeout' or device.currentEvent.name == 'output_complete'
+
+def runUntilPromptMatchOrTimeout(device):
+    '''
+    The checkpoint of the commands: the device printed the prompt or timed out
+    '''
+    return device.currentEvent.name == 'timeout' or device.currentEvent.name == 'prompt-match' or device.currentEvent.name.endswith('_prompt')
+
+def joinLineOutputs(lineOutputs):
+    '''
+    Join the outputs of the script lines, skipping the empty outputs of the leading lines
+    '''
+    outputs = []
+    for lineOut in lineOutputs:
+        if outputs or lineOut != '':
+            outputs.append(lineOut)
+    return '\n'.join(outputs)
+
+# the ${name} and ${name.attribute} expressions of a template
+simpleExpression = re.compile(r'\$\{\s*([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)\s*\}')
+
+# the mako syntax other than the simple expressions: tags, control lines, comments and line continuations
+makoSyntax = re.compile(r'<%|^[ \t]*%|##|\\$', re.MULTILINE)
+
+def renderTemplate(text, **context):
+    '''
+    Render the mako template `text` with the `context` variables.
+
+    The templates made only of simple expressions are rendered without importing mako::
+
+      >>> renderTemplate('ssh ${device.username}@${host}', device=Device('r1', username='admin'), host='r1')
+      'ssh admin@r1'
+    '''
+    if not makoSyntax.search(text) and '${' not in simpleExpression.sub('', text):
+        def value(match):
+            names = match.group(1).split('.')
+            obj = context[names[0]]
+            for name in names[1:]:
+                obj = getattr(obj, name)
+            return str(obj)
+        return simpleExpression.sub(value, text)
+
+    from mako.template import Template #@UnresolvedImport
+    return Template(text).render(**context)
+
 def getExactStringForMatch(str):
     '''
     Used for example to escape special characters in prompt strings 
@@ -328,6 +429,38 @@ def getExactStringForMatch(str):
     
     return match
 
+def repeatedPrompt(output, count):
+    '''
+    Return the prompt answered to `count` empty lines or None if the answers disagree.
+
+    The answers are the lines after the last `count` line breaks: the terminal may echo all the empty lines
+    before the device prints the prompts, so a line may hold more than one prompt, but every line holds only
+    prompts and the prompts are `count`::
+
+      >>> repeatedPrompt('Welcome\\r\\nr1>\\r\\nr1>\\r\\nr1>', 3)
+      'r1>'
+      >>> repeatedPrompt('\\r\\n\\r\\n$ $ ', 2)
+      '$ '
+      >>> repeatedPrompt('\\r\\n[1]>\\r\\n[2]>', 2) is None
+      True
+      >>> repeatedPrompt('aaa', 3) is None
+      True
+    '''
+    lines = output.replace('\r', '').split('\n')
+    if len(lines) <= count:
+        return None
+    answers = [line for line in lines[-count:] if line]
+    (length, rest) = divmod(sum([len(answer) for answer in answers]), count)
+    if rest or length == 0:
+        return None
+    prompt = answers[-1][-length:]
+    if not prompt.strip():
+        return None
+    for answer in answers:
+        if answer != prompt * (len(answer) // length):
+            return None
+    return prompt
+
 def discoverPromptCallback(device, tentativePrompt=None):
     '''
     The discover prompt algorithm
@@ -351,7 +484,7 @@ def discoverPromptCallback(device, tentativePrompt=None):
     log.debug("[%s] prompt discovery ..." % (device.name))
 
     # stop the default handling of the timeout event
-    device.currentEvent.stopPropagation()
+    device.stopPropagation()
     
     sts = device.state
 
@@ -376,12 +509,16 @@ def discoverPromptCallback(device, tentativePrompt=None):
                 device.remove_event_handler(ev, discoverPromptCallback)
             
             # declare the discovery with the event
-            device.currentEvent = Event('prompt-match')
+            device.currentEvent = internedEvent('prompt-match')
             
             return
             
         else:
             device.remove_pattern(getExactStringForMatch(device.prompt[sts].value), sts)
+
+            # the cached prompt, if any, is stale
+            if cache_enabled():
+                evict_cached_prompt(device, device.prompt[sts].value)
             
             if device.discoveryCounter == 2:
                 log.debug("[%s] [%s] unable to found the prompt, unsetting discovery. last output: [%s]" % (device.name, sts, output))
@@ -417,18 +554,18 @@ def discoverPromptCallback(device, tentativePrompt=None):
     device.expect(lambda d: d.currentEvent.name == 'timeout' or d.currentEvent.name == 'prompt-match')
 
 
-def buildPatternsList(device, driver=None):
+def buildPatternsList(fsm, driver=None):
     '''
-    Setup the expect patterns and the action events from the configobj 
+    Setup the expect patterns and the action events of the fsm tables from the configobj
     '''
    
     if driver == None:
-        driver = device.driver
+        driver = fsm.driver
    
     log.debug("loading driver [%s]" % driver)
     if hasattr(driver, 'parent'):
         log.debug("[%s] parent driver: [%s]" % (driver, driver.parent))
-        buildPatternsList(device, Driver.get(driver.parent))
+        buildPatternsList(fsm, Driver.get(driver.parent))
     
     if driver.name not in configObj:
         log.debug("skipping undefined [%s] section" % (driver.name))
@@ -452,12 +589,29 @@ def buildPatternsList(device, driver=None):
         if 'pattern' in eventData:
             pattern = eventData['pattern']
             
-        device.add_event_action(event=eventKey, pattern=pattern, action=action, beginState=states, endState=endState)
+        addEventAction(fsm, event=eventKey, pattern=pattern, action=action, beginState=states, endState=endState)
+
+
+
+# action string --> callable, the actions resolved by buildAction and get_callable
+resolvedActions = {}
 
+def invalidate_actions():
+    '''
+    Forget the resolved actions: the actions are resolved again, for example after changing the handlers module
+    '''
+    resolvedActions.clear()
 
 
 def buildAction(actionString):
-    
+    '''
+    Return the callable of the action string: ``method`` or the parameterized forms ``method arg ...`` and ``:method:arg:...:``
+    '''
+    try:
+        return resolvedActions[actionString]
+    except KeyError:
+        pass
+
     if actionString.startswith(':'):
         al = actionString.split(':')
         al = al[1:-1]
@@ -474,6 +628,7 @@ def buildAction(actionString):
     else:
         action = get_callable(actionString)
     
+    resolvedActions[actionString] = action
     return action
 
 
@@ -488,28 +643,13 @@ def get_callable(methodName):
     if methodName == '' or methodName is None:
         return None
 
-    log.debug('looking for action [%s]' % methodName)
-    import pyco.actions
     if isinstance(methodName,str):
         try:
-            if hasattr(pyco, 'pyco_home'):
-                
-                sys.path.append(pyco.pyco_home)
-                
-                try:
-                    log.debug('looking for [%s] into actions module' % methodName)
-                    import handlers #@UnresolvedImport
-                    return getattr(handlers, methodName)
-                except:
-                    log.debug('looking for [%s] into pyco package' % methodName)
-                    return getattr(pyco.actions, methodName)
-            else:
-                return getattr(pyco.actions, methodName)
-        except:
-            if methodName in globals():
-                return globals()[methodName]
-            else:
-                raise EventHandlerUndefined(methodName)
+            return resolvedActions[methodName]
+        except KeyError:
+            pass
+        resolvedActions[methodName] = resolveCallable(methodName)
+        return resolvedActions[methodName]
     else:
         def composite(d):
             for m in methodName:
@@ -517,6 +657,31 @@ def get_callable(methodName):
         return composite
 
 
+def resolveCallable(methodName):
+    log.debug('looking for action [%s]' % methodName)
+    import pyco.actions
+    try:
+        if hasattr(pyco, 'pyco_home'):
+            
+            if pyco.pyco_home not in sys.path:
+                sys.path.append(pyco.pyco_home)
+            
+            try:
+                log.debug('looking for [%s] into actions module' % methodName)
+                import handlers #@UnresolvedImport
+                return getattr(handlers, methodName)
+            except:
+                log.debug('looking for [%s] into pyco package' % methodName)
+                return getattr(pyco.actions, methodName)
+        else:
+            return getattr(pyco.actions, methodName)
+    except:
+        if methodName in globals():
+            return globals()[methodName]
+        else:
+            raise EventHandlerUndefined(methodName)
+
+
 def cliIsConnected(target):
     log.debug("[%s] [%s] state, [%s] event: checking if CLI is connected ..." % (target.name, target.state, target.currentEvent.name))
 
@@ -531,6 +696,9 @@ def cliIsConnected(target):
     else:
 
         if target.discoverPrompt:
+            if target.discoveryProbes > 1 and target.probe_prompt():
+                return True
+
             log.debug("[%s] starting [%s] prompt discovery" % (target.name, target.state))
             target.enable_prompt_discovery()
             
@@ -548,19 +716,131 @@ def commandError(target):
     raise CommandExecutionError(target)
 
 
+# the event and state names of the FSM transitions --> small integer ids
+symbols = {}
+symbolsLock = threading.Lock()
+
+def symbol(name):
+    '''
+    Return the id of the event or state name, interning the name on the first request
+    '''
+    try:
+        return symbols[name]
+    except KeyError:
+        with symbolsLock:
+            return symbols.setdefault(name, len(symbols))
+
+# the event names --> shared Event instances
+events = {}
+
+def internedEvent(name):
+    '''
+    Return the Event of the name, built on the first request
+    '''
+    try:
+        return events[name]
+    except KeyError:
+        return events.setdefault(name, Event(name))
+
+def transitionKey(eventId, stateId):
+    '''
+    The key of the (event, state) transitions
+    '''
+    return (eventId << 32) | stateId
+
+
+# the FSM tables builders, used by :py:class:`CompiledFsm` and by the :py:class:`Device` methods
+# that change the tables: the fsm argument is any object with the FSM tables attributes
+
+def addTransition(fsm, input_symbol, state, action=None, next_state=None):
+    '''
+    Add the (input_symbol, state) --> (action, next_state) transition to the fsm tables
+    '''
+    if next_state is None:
+        next_state = state
+    symbol(next_state)
+    fsm.state_transitions[transitionKey(symbol(input_symbol), symbol(state))] = (action, next_state)
+    fsm.transitionIndex = None
+
+def addTransitionAny(fsm, state, action=None, next_state=None):
+    '''
+    Add the (state) --> (action, next_state) transition, matching any input symbol, to the fsm tables
+    '''
+    if next_state is None:
+        next_state = state
+    symbol(next_state)
+    fsm.state_transitions_any[symbol(state)] = (action, next_state)
+    fsm.transitionIndex = None
+
+def addInputAny(fsm, input_symbol, action=None, next_state=None):
+    '''
+    Add the (input_symbol) --> (action, next_state) transition, matching any state, to the fsm tables
+    '''
+    if next_state is not None:
+        symbol(next_state)
+    fsm.input_transitions_any[symbol(input_symbol)] = (action, next_state)
+    fsm.transitionIndex = None
+
+def setDefaultTransition(fsm, action, next_state):
+    '''
+    Set the transition of the fsm used when no other transition matches
+    '''
+    fsm.default_transition = (action, next_state)
+    fsm.transitionIndex = None
+
+def addEventAction(fsm, event, pattern=None, beginState=['*'], endState=None, action=None):
+    '''
+    Add the event pattern and its transition to the fsm tables, see :py:meth:`Device.add_event_action`
+    '''
+    if isinstance(beginState, str):
+        beginState = [beginState]
+
+    for state in beginState:
+
+        if not pattern or pattern == '':
+            if state == '*':
+                log.debug("[%s]: [%s] event with empty pattern activated in any state" % (fsm.name, event))
+                addInputAny(fsm, event, action, endState)
+            else:
+                log.debug("[%s] adding transition [%s-%s (action:%s)-%s]" % (fsm.name, state, event, action, endState))
+                addTransition(fsm, event, state, action, endState)
+
+            continue
+
+        fsm.patternTable = {}
+        try:
+            reverseMap = dict([(item[1],item[0]) for item in list(fsm.patternMap[state].items())])
+            fsm.patternMap[state][pattern] = event
+            log.debug('[%s-%s]: configuring [%s] event [%s]' % (fsm.name, state, pattern, event))
+            if event in reverseMap and pattern != reverseMap[event]:
+                log.debug('[%s]: deleting event [%s]' % (fsm.name, event))
+                del fsm.patternMap[state][reverseMap[event]]
+        except:
+            fsm.patternMap[state] = {pattern:event}
+
+        #  add the transition
+        if state == '*':
+            log.debug("[%s]: adding pattern driven transition in any state [%s-%s (action:%s)-%s]" % (fsm.name, state, event, action, endState))
+            addInputAny(fsm, event, action, endState)
+        else:
+            log.debug("[%s]: adding pattern driven transition [%s-%s (action:%s)-%s]" % (fsm.name, state, event, action, endState))
+            addTransition(fsm, event, state, action, endState)
+
+
 class Event:
-    def __init__(self, name, propagateToFsm=True):
+    '''
+    An FSM event: the events are shared by all the devices, see internedEvent(), and are never modified.
+    The propagation of the current event to the FSM is tracked by the device
+    '''
+    __slots__ = ('name', 'id')
+
+    def __init__(self, name):
         self.name = name
-        self.propagate = propagateToFsm
+        # None if no transition was defined for the event when the event was built, for example the lines sent to the device
+        self.id = symbols.get(name)
         
     def __str__(self):
         return self.name    
-        
-    def stopPropagation(self):
-        self.propagate = False
-        
-    def isActive(self):
-        return self.propagate
     
     def isTimeout(self):
         return self.name == 'timeout'
@@ -569,6 +849,7 @@ class Event:
         return self.name == 'prompt-match' or self.name.endswith('_prompt')
     
 class Prompt:
+    __slots__ = ('value', 'tentative')
     
     def __init__(self, promptValue, tentative=False):
         self.value = promptValue
@@ -649,6 +930,9 @@ class Device:
 
         # the finite state machine
         self.state = 'GROUND'
+        self._currentEvent = None
+        # False when the current event was already processed by the FSM or a handler stopped its propagation
+        self.propagate = True
 
         if not driver:
             self.driver = Driver.get('common')
@@ -668,13 +952,29 @@ class Device:
         if attrname == 'driver':
             raise AttributeError(attrname)
         else:
-            #log.debug("[%s] delegating search for [%s] to [%s]" % (self, attrname, self.driver))
+            # the driver settings already include the values inherited from the parent drivers
             try:
-                return getattr(self.driver, attrname)
-            except AttributeError:
-                raise AttributeError(attrname)
+                return self.driver.settings[attrname]
+            except KeyError:
+                raise AttributeError(attrname) from None
 
 
+    @property
+    def currentEvent(self):
+        return self._currentEvent
+
+    @currentEvent.setter
+    def currentEvent(self, event):
+        # the events are shared: a new current event is always propagated to the FSM
+        self._currentEvent = event
+        self.propagate = True
+
+    def stopPropagation(self):
+        '''
+        Do not process the current event with the FSM
+        '''
+        self.propagate = False
+
     def get_driver(self):
         return self.driver.name
 
@@ -684,21 +984,48 @@ class Device:
         '''
         self.driver = Driver.get(driverName)
         
-        # Map (input_symbol, current_state) --> (action, next_state).
-        self.state_transitions = {}
-        # Map (current_state) --> (action, next_state).
-        self.state_transitions_any = {}
-        self.input_transitions_any = {}
-        self.default_transition = None
-
-        self.patternMap = {'*':{}}
-        buildPatternsList(self)
-
-        self.set_default_transition(defaultEventHandler, None)
+        # the FSM tables are shared with all the devices of the driver until the device changes them
+        self.share_fsm(self.driver.compiled_fsm())
         
         # simply ignore 'prompt-match' on any state
         #self.add_input_any('prompt-match')
 
+    def share_fsm(self, fsm):
+        '''
+        Use the read only FSM tables compiled by the driver
+        '''
+        self.sharedFsm = fsm
+
+        # Map transitionKey(input_symbol id, current_state id) --> (action, next_state).
+        self.state_transitions = fsm.state_transitions
+        # Map (current_state id) --> (action, next_state).
+        self.state_transitions_any = fsm.state_transitions_any
+        # Map (input_symbol id) --> (action, next_state).
+        self.input_transitions_any = fsm.input_transitions_any
+        self.default_transition = fsm.default_transition
+
+        # state --> {pattern: event}
+        self.patternMap = fsm.patternMap
+        # (state, patternsExt) --> (patterns, compiled patterns), built from patternMap on demand
+        self.patternTable = fsm.patternTable
+        # the dense transition table, None until the first lookup and False if not enabled
+        self.transitionIndex = None
+
+    def own_fsm(self):
+        '''
+        Copy the shared FSM tables before the first change: the changes of the device do not affect the other devices
+        '''
+        if self.sharedFsm is None:
+            return
+        log.debug("[%s] copying the [%s] FSM tables" % (self.name, self.driver))
+        self.state_transitions = dict(self.state_transitions)
+        self.state_transitions_any = dict(self.state_transitions_any)
+        self.input_transitions_any = dict(self.input_transitions_any)
+        self.patternMap = dict([(state, dict(patterns)) for (state, patterns) in self.patternMap.items()])
+        self.patternTable = {}
+        self.transitionIndex = None
+        self.sharedFsm = None
+
 
     def enable_prompt_discovery(self):
         """
@@ -711,9 +1038,9 @@ class Device:
         if cache_enabled():
             prompt = get_cached_prompt(self)
             if prompt:
-                log.debug('[%s] found cached [%s] prompt [%s]' % (self.name, self.state, prompt.prompt))
-                self.prompt[self.state] = Prompt(prompt.prompt, tentative=True)
-                self.add_expect_pattern('prompt-match', getExactStringForMatch(prompt.prompt), self.state)
+                log.debug('[%s] found cached [%s] prompt [%s]' % (self.name, self.state, prompt))
+                self.prompt[self.state] = Prompt(prompt, tentative=True)
+                self.add_expect_pattern('prompt-match', getExactStringForMatch(prompt), self.state)
                 self.discoveryCounter = 0
 
             else:
@@ -721,8 +1048,13 @@ class Device:
             
         #self.expect(lambda d: d.currentEvent.name == 'timeout' or d.currentEvent.name == 'prompt-match')
 
-    def interaction_log(self):
-        return self.esession.logfile.getvalue()
+    def interaction_log(self, tail=None):
+        '''
+        Return the characters exchanged with the device, or only the last `tail` ones
+        '''
+        if tail is None:
+            return self.esession.logfile.getvalue()
+        return self.esession.logfile.tail(tail)
 
     def is_connected(self):
         '''
@@ -747,14 +1079,47 @@ class Device:
         return SOURCE_HOST
     
     def close(self):
-        
+        '''
+        Close the connection to the device.
+
+        If `returnToHop` is True and the device is reached through a path, the `exitCommand` is sent and
+        the connection to the previous hop is left open: the next device reached through the same hop
+        objects skips the connection of the upstream legs.
+        '''
         if hasattr(self, 'esession'):
-            if self.currentEvent.name != 'eof':
+            if self.returnToHop and self.loggedin and self.currentEvent.name != 'eof' and self.esession.return_to_hop(self):
+                # the session now belongs to the hop
+                del self.esession
+            elif self.currentEvent.name != 'eof':
                 self.esession.close()
 
+        self.loggedin = False
         self.state = 'GROUND'
         
 
+    def probe_prompt(self):
+        '''
+        Send `discoveryProbes` empty lines at once and take the prompt repeated by all the answers as the
+        discovered prompt. Return False if the answers disagree: the discovery falls back to the tentative prompt rounds.
+        '''
+        self.clear_buffer()
+        for _ in range(self.discoveryProbes):
+            self.esession.send_line('')
+        output = self.esession.read_until(lambda out: repeatedPrompt(out, self.discoveryProbes) is not None,
+                                          self.quietPeriod, self.maxWait)
+        prompt = repeatedPrompt(output, self.discoveryProbes)
+        if prompt is None:
+            log.debug("[%s] [%s] probes answers disagree: [%s]" % (self.name, self.state, output))
+            return False
+
+        log.debug("[%s] [%s] prompt probed: [%s]" % (self.name, self.state, prompt))
+        self.prompt[self.state] = Prompt(prompt, tentative=False)
+        self.add_expect_pattern('prompt-match', getExactStringForMatch(prompt), self.state)
+        if cache_enabled():
+            save_cached_prompt(self)
+        self.currentEvent = internedEvent('prompt-match')
+        return True
+
     def discover_prompt_with_regexp(self, regexp, state='*'):
         '''
         Use regexp as a hint for prompt discovery 
@@ -785,18 +1150,15 @@ class Device:
         try:
             return self.patternMap[self.state][pattern]
         except:
+            if pattern == markerPattern:
+                return 'output_complete'
             # TODO: raise an exception if event not found
             return self.patternMap['*'][pattern]
 
 
     def connect_command(self, clientDevice):
         
-        for ep in iter_entry_points(group='pyco.plugin', name=None):
-            log.debug("found [%s] plugin into module [%s]" % (ep.name, ep.module_name))
-            authFunction = ep.load()
-            if authFunction(self):
-                break
-
+        plugins.authenticate(self)
         
         if self.protocol == 'ssh':
             # the username must be defined for ssh connections
@@ -816,14 +1178,78 @@ class Device:
         else:
             raise UnsupportedProtocol(self, 'unsupported protocol: %s' % self.protocol)
 
-        template = Template(command)
+        command = renderTemplate(command, device=self)
+        if self.protocol == 'ssh' and self.sshMultiplex and clientDevice.name == '__source_host__':
+            # the ssh client options go before the destination
+            (client, args) = command.split(' ', 1)
+            path = self.control_path()
+            # the socket directory is private: the other local users cannot replace the socket
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            command = '%s -o ControlMaster=auto -o ControlPath=%s -o ControlPersist=%s %s' % (client, path, self.controlPersist, args)
+        
+        return command
+
+    def control_path(self):
+        '''
+        The path of the ssh master connection socket shared by the sessions toward the device.
 
-        clicommand = StringIO()
-        context = Context(clicommand, device=self)
+        The controlPath template may use `pyco_home` and `digest`, a short hash of the username, name and port of the device
+        that keeps the socket path below the unix socket path limit
+        '''
+        digest = hashlib.sha1(('%s@%s:%s' % (self.username, self.name, self.port)).encode()).hexdigest()[:20]
+        return renderTemplate(self.controlPath, device=self, pyco_home=pyco.pyco_home, digest=digest)
 
-        template.render_context(context)
-        
-        return clicommand.getvalue()
+    def ssh_master_alive(self):
+        '''
+        Return True if the device is the first hop of the path and a ssh master connection toward it is alive:
+        the new session is opened as a channel of the master connection without authenticating again.
+        '''
+        (path, alive) = self.cached_ssh_master()
+        if alive is None:
+            check = subprocess.call(['ssh', '-O', 'check', '-S', path, self.name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            alive = self.ssh_master_checked(path, check)
+        return alive
+
+    def cached_ssh_master(self):
+        '''
+        Return the (control path, alive) pair, alive is None if the master connection has to be checked with ``ssh -O check``.
+
+        A master connection found alive stays open at least controlPersist seconds after the check,
+        because the sessions opened in the meantime keep it open: it is not checked again for controlPersist seconds
+        '''
+        if self.protocol != 'ssh' or not self.sshMultiplex:
+            return (None, False)
+        path = self.control_path()
+        if not os.path.exists(path):
+            sshMasters.pop(path, None)
+            return (path, False)
+        now = time.time()
+        if now - sshMasters.get(path, 0) < self.controlPersist:
+            log.debug("[%s] ssh master connection [%s] alive" % (self.name, path))
+            sshMasters[path] = now
+            return (path, True)
+        return (path, None)
+
+    def ssh_master_checked(self, path, check):
+        '''
+        Record the exit status of the ``ssh -O check`` command
+        '''
+        log.debug("[%s] ssh master connection [%s] check: [%s]" % (self.name, path, check))
+        if check == 0:
+            sshMasters[path] = time.time()
+            return True
+        sshMasters.pop(path, None)
+        return False
+
+    def skip_authentication(self):
+        '''
+        Enter the authenticatedState state, generating the authenticatedEvent event, without the username/password dialog,
+        because the connection is already authenticated
+        '''
+        log.debug("[%s] connection already authenticated, skipping the login dialog" % self.name)
+        self.state = self.authenticatedState
+        self.currentEvent = internedEvent(self.authenticatedEvent)
+        self.process(self.currentEvent, ext=False)
  
         
     def has_event_handlers(self, event):
@@ -855,7 +1281,7 @@ class Device:
         from pyco.expectsession import ExpectSession
         log.debug("%s login ..." % self.name)
         self.esession = ExpectSession(self.hops,self)
-        self.currentEvent = Event('do-nothing-event')
+        self.currentEvent = internedEvent('do-nothing-event')
         
         log.debug("[%s] session: [%s]" % (self.name, self.esession))
         
@@ -864,7 +1290,7 @@ class Device:
         except ExpectException as e:
             # something go wrong, try to find the last connected hop in the path
             log.info("[%s]: in login phase got [%s] error" % (e.device.name ,e.__class__))
-            log.debug("full interaction: [%s]" % e.interaction_log)
+            log.debug("interaction log tail: [%s]" % e.interaction_log)
             raise e
             
         self.clear_buffer()
@@ -890,8 +1316,8 @@ class Device:
         
         log.debug('generating event [%s]' % stringValue)
         
-        event = Event(stringValue)
-        self.process(event)
+        # the lines are not interned: a line without transitions gets its own event
+        self.process(events.get(stringValue) or Event(stringValue))
         
         log.debug("[%s] sending [%s]" % (self, stringValue))
         self.esession.send_line(stringValue)
@@ -915,92 +1341,249 @@ class Device:
         if self.state == 'GROUND':
             self.login()
 
-        if param_map:
-            template = Template(script_or_template)
-    
-            clicommand = StringIO()
-            context = Context(clicommand, **param_map)
-    
-            template.render_context(context)
-            
-            command = clicommand.getvalue()
+        command = self.render_script(script_or_template, param_map)
+        return joinLineOutputs(self.process_lines(command.split('\n')))
+
+    def process_lines(self, lines):
+        '''
+        Send the script lines to the device and generate the output of every line.
+        
+        If `pipelineWindow` is greater than 1 the lines are pipelined, see :py:meth:`pyco.device.Device.process_pipelined_lines`
+        '''
+        if self.pipelining():
+            for lineOut in self.process_pipelined_lines(lines):
+                yield lineOut
         else:
-            command = script_or_template
+            for line in lines:
+                log.debug('[%s]: sending line [%s]' % (self.name, line))
+                yield self.process_single_line(line)
+
+    def process_pipelined_lines(self, lines):
+        '''
+        Send the script lines without waiting the prompt of the previous line and generate the output of every line.
+        
+        At most `pipelineWindow` lines are waiting for the prompt at the same time, and the output of a line
+        is the output received until its prompt-match event.
+        An error event or a timeout stop the script as usual, but the lines of the window following the failed one were already sent. 
+        '''
+        for (pipelined, line) in self.pipeline_window(lines):
+            for sent in pipelined:
+                self.send_line(sent)
             
-        out = ''
-        for line in command.split('\n'):
-            log.debug('[%s]: sending line [%s]' % (self.name, line))
-            if out != '':
-                out += '\n'
-            out += self.process_single_line(line)
+            out = self.esession.processResponse(self, runUntilPromptMatchOrTimeout)
+            self.prompt_timeout(out)
             
-        return out 
+            yield self.strip_command(line, out)
 
-    def process_single_line(self, command):
+    def pipelining(self):
         '''
-        Send the command string to the device and return the command output.
+        True if the script lines are pipelined: the prompt rediscovery after a timeout needs the sequential processing
+        '''
+        return self.pipelineWindow > 1 and not (self.discoverPrompt == True and self.rediscovery_enabled())
+
+    def pipeline_window(self, lines):
+        '''
+        Generate the (lines to send, line) pairs of a pipelined script: the lines to send keep the window full
+        before waiting for the prompt of `line`
+        '''
+        sent = 0
+        for (done, line) in enumerate(lines):
+            pipelined = lines[sent:done + self.pipelineWindow]
+            for pending in pipelined:
+                log.debug('[%s]: pipelining line [%s]' % (self.name, pending))
+            sent += len(pipelined)
+            yield (pipelined, line)
+
+    def stream(self, command, chunk_size=None):
+        '''
+        Send the command string to the device and return a generator of the command output.
         
-        After sending the command with :py:meth:`pyco.device.Device.send_line` activate a `processResponse` loop and awaits one of
-        the expected results or a timeout.
+        The output is yielded in chunks of complete lines as soon as it arrives, while the events like the
+        pager ones are handled as usual: the generator stops when the prompt matches. 
+        `chunk_size` is the maximum number of characters read at once from the device, by default the read
+        size of the expect session.
+        
+        Use it in place of :py:meth:`pyco.device.Device.send` for very large outputs that do not fit into memory::
         
+            for chunk in h.stream('show ip bgp'):
+                parse(chunk)
         '''
-        #self.clear_buffer()
+        if self.state == 'GROUND':
+            self.login()
+
+        if chunk_size is None:
+            chunk_size = self.esession.pipe.maxread
+
         self.send_line(command)
 
-        def runUntilPromptMatchOrTimeout(device):
-            #return device.currentEvent.name == 'timeout' or device.currentEvent.name == 'prompt-match' or device.currentEvent.name.endswith('_prompt')
-            return device.currentEvent.name == 'timeout' or device.currentEvent.name == 'prompt-match' or device.currentEvent.name.endswith('_prompt')
+        echo = command
+        for chunk in self.esession.processStream(self, runUntilPromptMatchOrTimeout, chunk_size):
+            if echo is not None:
+                # the first lines contain the echoed command
+                if chunk.startswith(echo):
+                    chunk = chunk[len(echo):].lstrip('\r\n')
+                echo = None
+            if chunk:
+                yield chunk
 
-        out = self.esession.processResponse(self, runUntilPromptMatchOrTimeout)
-        
         if self.currentEvent.name == 'timeout' and self.discoverPrompt == True:
+            raise ConnectionTimedOut(self, 'prompt not hooked')
+
+    def render_script(self, script_or_template, param_map=None):
+        '''
+        Return the plain script obtained substituting the `param_map` entries into the `script_or_template` template. 
+        '''
+        if param_map:
+            return renderTemplate(script_or_template, **param_map)
+        else:
+            return script_or_template
+
+    def process_single_line(self, command):
+        '''
+        Send the command string to the device and return the command output.
+        
+        After sending the command with :py:meth:`pyco.device.Device.send_line` activate a `processResponse` loop and awaits one of
+        the expected results or a timeout.
+        
+        '''
+        if self.marker_enabled():
+            (marker, markerCommand) = self.completion_marker()
+            self.send_line(command)
+            self.esession.send_line(markerCommand)
             
-            if not hasattr(self, 'promptPattern') and hasattr(self, 'rediscoverPrompt') and self.rediscoverPrompt:
-            
-                # rediscover the prompt
-                log.debug("[%s] discovering again the prompt ..." % self.name)
-                tentativePrompt = out.split('\r\n')[-1]
-                log.debug('[%s] taking last line as tentativePrompt: [%s]' % (self.name, tentativePrompt))
-                self.enable_prompt_discovery()
-                discoverPromptCallback(self, tentativePrompt)
-            else:
-                raise ConnectionTimedOut(self, 'prompt not hooked')
+            # the marker is matched by the fixed markerPattern: the FSM patterns are not changed for every command
+            chunks = [self.esession.processResponse(self, runUntilOutputCompleteOrTimeout, self.marker_patterns())]
+            while not self.marker_matched(marker):
+                chunks.append(self.esession.processResponse(self, runUntilOutputCompleteOrTimeout, self.marker_patterns()))
+                
+            if self.currentEvent.name == 'output_complete':
+                # consume the prompt following the marker
+                self.esession.processResponse(self, runUntilPromptMatchOrTimeout)
+            out = self.strip_marker(''.join(chunks), marker, markerCommand)
+        else:
+            #self.clear_buffer()
+            self.send_line(command)
+            out = self.esession.processResponse(self, runUntilPromptMatchOrTimeout)
+        
+        self.prompt_timeout(out)
 
         # TODO: to be evaluated if this check is useful   
-        if self.checkIfOutputComplete == True:
+        if self.recheck_output():
             log.debug("Checking if [%s] response [%s] is complete" % (command,out))
-            prevOut = None
-            while out != prevOut:
+            chunks = [out]
+            currOut = None
+            while currOut != '':
                 self.clear_buffer()
-                log.debug("[%s] == [%s]" % (prevOut,out))
-                prevOut = out
                 currOut = self.esession.processResponse(self, runUntilPromptMatchOrTimeout)
-                if prevOut == None:
-                    out = currOut
-                else:
-                    out = prevOut + currOut
-                log.debug("Rechecking if [%s] response [%s] is complete" % (command,out))
-        
-        if out.startswith(command):
-            out = out.replace(command.replace('\n','\r\n'), '', 1).strip('\r\n')  
-        log.info("[%s:%s]: captured response [%s]" % (self.name, command, out))
+                chunks.append(currOut)
+                log.debug("Rechecking if [%s] response is complete, got [%s]" % (command,currOut))
+            out = ''.join(chunks)
         
-        return out
+        return self.strip_command(command, out)
 
-    def clear_buffer(self):
-        log.debug('clearing buffer ...')
+    def prompt_timeout(self, out):
+        '''
+        Handle the timeout of a command waiting for the prompt, if `discoverPrompt` is set: raise ConnectionTimedOut
+        or, if the driver sets `rediscoverPrompt`, discover again the prompt taking the last line of `out` as tentative prompt.
+        Return True if the prompt discovery started.
+        '''
+        if self.currentEvent.name != 'timeout' or self.discoverPrompt != True:
+            return False
         
-        try:
-            # expect some time (default: 2 seconds) the arrivals of terminal characters and then clears the buffer 
-            time.sleep(self.waitBeforeClearingBuffer)
-            self.esession.pipe.expect('.*', timeout=1)
-            
-        except Exception as e:
-            log.debug("[%s] clear_buffer timeout: cleared expect buffer (%s)" % (self.name, e.__class__))
-            log.debug(e)
+        if not self.rediscovery_enabled():
+            raise ConnectionTimedOut(self, 'prompt not hooked')
+
+        # rediscover the prompt
+        log.debug("[%s] discovering again the prompt ..." % self.name)
+        tentativePrompt = out.split('\r\n')[-1]
+        log.debug('[%s] taking last line as tentativePrompt: [%s]' % (self.name, tentativePrompt))
+        self.enable_prompt_discovery()
+        discoverPromptCallback(self, tentativePrompt)
+        return True
 
+    def rediscovery_enabled(self):
+        '''
+        True if the prompt is discovered again after a timeout, see `rediscoverPrompt`
+        '''
+        return not hasattr(self, 'promptPattern') and hasattr(self, 'rediscoverPrompt') and self.rediscoverPrompt
 
-    def add_transition (self, input_symbol, state, action=None, next_state=None):
+    def recheck_output(self):
+        '''
+        True if the output of the commands is checked again after the prompt, see `checkIfOutputComplete`
+        '''
+        return self.checkIfOutputComplete == True and not self.completionMarker
+
+    def marker_enabled(self):
+        '''
+        True if the commands are completed by a marker, see `completionMarker`
+        '''
+        return self.completionMarker and not self.exactPatternMatch
+
+    def marker_patterns(self):
+        '''
+        The patterns matched in addition to the FSM patterns while waiting for the marker
+        '''
+        from pexpect import TIMEOUT #@UnresolvedImport
+        return [markerPattern, TIMEOUT]
+
+    def completion_marker(self):
+        '''
+        Return a new marker string and the driver `markerCommand` that prints it
+        '''
+        if not self.markerCommand:
+            # without the marker every command would wait the maxWait timeout
+            raise MissingDeviceParameter(self, '[%s] driver: completionMarker enabled without a markerCommand' % self.driver.name)
+        nonce = uuid.uuid4().hex[:12]
+        return ('__pyco_%s__' % nonce, renderTemplate(self.markerCommand, nonce=nonce))
+
+    def marker_matched(self, marker):
+        '''
+        True if the output is complete or timed out: a marker with another nonce, printed
+        after the timeout of a previous command, does not complete the output
+        '''
+        if self.currentEvent.name == 'output_complete' and self.esession.pipe.after != marker:
+            log.debug("[%s] skipping stale marker [%s]" % (self.name, self.esession.pipe.after))
+            return False
+        return True
+
+    def strip_marker(self, out, marker, markerCommand):
+        '''
+        Remove the marker and the echoed marker command from the device response
+        '''
+        end = out.rfind(marker)
+        if end >= 0:
+            out = out[:end]
+        # the marker command may be echoed more times, in the middle of the output if typed ahead 
+        return re.sub(re.escape(markerCommand) + '\r*\n?', '', out)
+
+    def strip_command(self, command, out):
+        '''
+        Remove the echoed command from the device response
+        '''
+        if out.startswith(command):
+            out = out.replace(command.replace('\n','\r\n'), '', 1).strip('\r\n')  
+        log.info("[%s:%s]: captured response [%s]" % (self.name, command, out))
+        
+        return out
+
+    def clear_buffer(self):
+        log.debug('clearing buffer ...')
+        
+        try:
+            # expect some time (default: 2 seconds) the arrivals of terminal characters and then clears the buffer:
+            # if quietPeriod is set stop waiting as soon as the line is idle for quietPeriod seconds
+            if self.quietPeriod:
+                self.esession.wait_quiescence(self.quietPeriod, self.waitBeforeClearingBuffer)
+            else:
+                time.sleep(self.waitBeforeClearingBuffer)
+            self.esession.pipe.expect_list([ANY_OUTPUT], timeout=1)
+            
+        except Exception as e:
+            log.debug("[%s] clear_buffer timeout: cleared expect buffer (%s)" % (self.name, e.__class__))
+            log.debug(e)
+
+
+    def add_transition (self, input_symbol, state, action=None, next_state=None):
 
         """This adds a transition that associates:
 
@@ -1013,9 +1596,8 @@ class Device:
         You can also set transitions for a list of symbols by using
         add_transition_list(). """
 
-        if next_state is None:
-            next_state = state
-        self.state_transitions[(input_symbol, state)] = (action, next_state)
+        self.own_fsm()
+        addTransition(self, input_symbol, state, action, next_state)
 
     def add_transition_list (self, list_input_symbols, state, action=None, next_state=None):
 
@@ -1047,9 +1629,8 @@ class Device:
         ignore the action and only set the next_state. The next_state may be
         set to None in which case the current state will be unchanged. """
 
-        if next_state is None:
-            next_state = state
-        self.state_transitions_any [state] = (action, next_state)
+        self.own_fsm()
+        addTransitionAny(self, state, action, next_state)
 
     def add_input_any (self, input_symbol, action=None, next_state=None):
 
@@ -1065,7 +1646,8 @@ class Device:
         ignore the action and only set the next_state. The next_state may be
         set to None in which case the current state will be unchanged. """
 
-        self.input_transitions_any [input_symbol] = (action, next_state)
+        self.own_fsm()
+        addInputAny(self, input_symbol, action, next_state)
 
 
     def set_default_transition (self, action, next_state):
@@ -1079,9 +1661,9 @@ class Device:
         The default transition can be removed by setting the attribute
         default_transition to None. """
 
-        self.default_transition = (action, next_state)
+        setDefaultTransition(self, action, next_state)
 
-    def get_transition (self, input_symbol, state):
+    def get_transition (self, input_symbol, state, eventId=None):
 
         """This returns (action, next state) given an input_symbol and state.
         This does not modify the ExtFSM state, so calling this method has no side
@@ -1105,20 +1687,64 @@ class Device:
             This is a handler for errors, undefined states, or defaults.
 
         5. No transition was defined. If we get here then raise an exception.
+
+        The tables are keyed by the interned ids of the names: `eventId` is the id
+        of input_symbol, if already known.
         """
 
-        if (input_symbol, state) in self.state_transitions:
-            return self.state_transitions[(input_symbol, state)]
-        elif state in self.state_transitions_any:
-            return self.state_transitions_any[state]
-        elif input_symbol in self.input_transitions_any:
-            return self.input_transitions_any[input_symbol]
+        if eventId is None:
+            eventId = symbols.get(input_symbol)
+        stateId = symbols.get(state)
+
+        table = self.transitionIndex
+        if table is None or (table is not False and table.default is not self.default_transition):
+            table = self.compile_transitions()
+        if table is not False:
+            # the TransitionTable.get lookup inlined
+            width = table.width
+            row = table.rows[stateId] if stateId is not None and stateId < width else table.anyState
+            transition = row[eventId] if eventId is not None and eventId < width else row[-1]
+            if transition is not None:
+                return transition
+            raise FSMException ('Transition is undefined: (%s, %s).' %
+                (str(input_symbol), str(state)) )
+
+        if eventId is not None and stateId is not None:
+            transition = self.state_transitions.get(transitionKey(eventId, stateId))
+            if transition is not None:
+                return transition
+        if stateId in self.state_transitions_any:
+            return self.state_transitions_any[stateId]
+        elif eventId in self.input_transitions_any:
+            return self.input_transitions_any[eventId]
         elif self.default_transition is not None:
             return self.default_transition
         else:
             raise FSMException ('Transition is undefined: (%s, %s).' %
                 (str(input_symbol), str(state)) )
 
+    def compile_transitions(self):
+        '''
+        Build the dense transition table if the `transitionTable` option is `dense`, otherwise return False:
+        the table is rebuilt on the first lookup after a change of the transitions.
+        The devices sharing the driver FSM tables share the table too.
+        '''
+        if self.transitionTable != 'dense':
+            self.transitionIndex = False
+            return False
+
+        fsm = self.sharedFsm
+        if fsm is not None and fsm.transitionIndex is not None and fsm.transitionIndex.default is self.default_transition:
+            self.transitionIndex = fsm.transitionIndex
+            return self.transitionIndex
+
+        log.debug("[%s] compiling the dense transition table" % self.name)
+        self.transitionIndex = TransitionTable(self.state_transitions, self.state_transitions_any,
+                                               self.input_transitions_any, self.default_transition)
+        if fsm is not None and fsm.default_transition is self.default_transition:
+            fsm.transitionIndex = self.transitionIndex
+        return self.transitionIndex
+
     def process (self, event, ext=True):
 
         """This is the main method that you call to process input. This may
@@ -1130,30 +1756,32 @@ class Device:
         processes one complete input symbol. You can process a list of symbols
         (or a string) by calling process_list(). """
 
-        if event.isActive():
+        if event is not self._currentEvent or self.propagate:
             
-            # disactive the event
-            event.stopPropagation()
+            # disactive the current event
+            if event is self._currentEvent:
+                self.propagate = False
             
             input_symbol = event.name
             #self.input_symbol = input_symbol.name
-            (action, next_state) = self.get_transition (input_symbol, self.state)
-            log.debug("selected transition [event:%s,beginState:%s] -> [action:%s, endState:%s]" % (input_symbol, self.state, action, next_state))
+            (action, next_state) = self.get_transition (input_symbol, self.state, event.id)
+            # the hot path of the FSM: the log messages are formatted only if debug is enabled
+            log.debug("selected transition [event:%s,beginState:%s] -> [action:%s, endState:%s]", input_symbol, self.state, action, next_state)
             
             stateChanged = False
             
             if next_state != None:
-                log.debug("transition activated for [%s,%s] -> [%s]" % (input_symbol, self.state, next_state))
+                log.debug("transition activated for [%s,%s] -> [%s]", input_symbol, self.state, next_state)
                 stateChanged = (self.state != next_state)
                 self.state = next_state
                 
             if action is not None:
-                log.debug("[%s]: executing [%s] action [%s]" % (self.name, input_symbol, str(action)))
+                log.debug("[%s]: executing [%s] action [%s]", self.name, input_symbol, action)
                 action (self)
                 
             if stateChanged:
-                log.debug('generating event [%s]' % self.state.lower())
-                self.currentEvent = Event(self.state.lower())
+                log.debug('generating event [%s]', self.state.lower())
+                self.currentEvent = internedEvent(self.state.lower())
                 self.process(self.currentEvent,ext=False)
            
             return stateChanged
@@ -1175,44 +1803,64 @@ class Device:
         except:
             return list(self.patternMap['*'].keys())
 
-    def add_event_action(self, event, pattern=None, beginState=['*'], endState=None, action=None):
+    def pattern_table(self, state, patternsExt=[]):
         '''
-        Add a pattern to be matched in the FSM state. If the pattern is matched then the corresponding event is generated.
+        Return the pattern list and the corresponding list of compiled regular expressions
+        to match the device output in `state`, extended with the `patternsExt` items (for example pexpect.TIMEOUT).
         
-        If pattern is None only a transition is configured
+        The lists are built once from the patternMap and rebuilt only when a pattern is added or removed.
+        '''
+        key = (state, tuple(patternsExt))
+        try:
+            return self.patternTable[key]
+        except KeyError:
+            patterns = self.patterns(state) + list(patternsExt)
+            compiled = [re.compile(p, re.DOTALL) if isinstance(p, str) else p for p in patterns]
+            log.debug("[%s] compiled [%s] patterns table: %s" % (self.name, state, patterns))
+            self.patternTable[key] = (patterns, compiled)
+            return self.patternTable[key]
+
+    def alternation_searcher(self, state, patternsExt=[]):
         '''
-        if isinstance(beginState, str):
-            beginState = [beginState]
+        Return a new :py:class:`pyco.matcher.AlternationSearcher` matching all the `state` patterns with a single regular expression,
+        or None if the driver does not set ``matcher = alternation``.
         
-        for state in beginState:
-            
-            if not pattern or pattern == '':
-                if state == '*':
-                    log.debug("[%s]: [%s] event with empty pattern activated in any state" % (self.name, event))
-                    self.add_input_any(event, action, endState)
-                else:
-                    log.debug("[%s] adding transition [%s-%s (action:%s)-%s]" % (self.name, state, event, action, endState))
-                    self.add_transition(event, state, action, endState)
-                
-                continue
-            
+        The compiled :py:class:`pyco.matcher.Alternation` is cached, and it may be shared with the other devices of the driver,
+        while the searcher, that records the match, is built for every expect call.
+        Exact pattern matching and patterns that cannot be joined into an alternation fall back to the patterns list matching.
+        '''
+        if self.matcher != 'alternation' or self.exactPatternMatch:
+            return None
+        
+        key = ('alternation', state, tuple(patternsExt))
+        try:
+            alternation = self.patternTable[key]
+        except KeyError:
+            from pyco.matcher import Alternation
+            (patterns, compiled) = self.pattern_table(state, patternsExt)
+            stateMap = self.patternMap.get(state, {})
+            events = [stateMap.get(p, self.patternMap['*'].get(p, 'output_complete' if p == markerPattern else None)) for p in patterns]
             try:
-                reverseMap = dict([(item[1],item[0]) for item in list(self.patternMap[state].items())])
-                self.patternMap[state][pattern] = event
-                log.debug('[%s-%s]: configuring [%s] event [%s]' % (self.name, state, pattern, event))
-                if event in reverseMap and pattern != reverseMap[event]:
-                    log.debug('[%s]: deleting event [%s]' % (self.name, event))
-                    del self.patternMap[state][reverseMap[event]]
-            except:
-                self.patternMap[state] = {pattern:event}
+                alternation = Alternation(patterns, events)
+            except re.error as e:
+                log.warning("[%s] [%s] patterns cannot be joined into an alternation (%s), matching the patterns list" % (self.name, state, e))
+                alternation = None
+            self.patternTable[key] = alternation
+        if alternation is None:
+            return None
+        return alternation.searcher()
 
-            #  add the transition
-            if state == '*':
-                log.debug("[%s]: adding pattern driven transition in any state [%s-%s (action:%s)-%s]" % (self.name, state, event, action, endState))
-                self.add_input_any(event, action, endState)
-            else:
-                log.debug("[%s]: adding pattern driven transition [%s-%s (action:%s)-%s]" % (self.name, state, event, action, endState))
-                self.add_transition(event, state, action, endState)
+    def invalidate_pattern_table(self):
+        self.patternTable = {}
+
+    def add_event_action(self, event, pattern=None, beginState=['*'], endState=None, action=None):
+        '''
+        Add a pattern to be matched in the FSM state. If the pattern is matched then the corresponding event is generated.
+        
+        If pattern is None only a transition is configured
+        '''
+        self.own_fsm()
+        addEventAction(self, event, pattern, beginState, endState, action)
 
 
     def add_transition_object(self, t):
@@ -1239,6 +1887,8 @@ class Device:
             log.warning("[%s]: skipped [%s] event with empty pattern and * state" % (self.name, event))
             return
         
+        self.own_fsm()
+        self.invalidate_pattern_table()
         try:
             self.patternMap[state][pattern] = event
         except:
@@ -1252,8 +1902,10 @@ class Device:
             self.remove_pattern(pattern, state)
         
     def remove_pattern(self, pattern, state = '*'):
+        self.own_fsm()
         try:
             del self.patternMap[state][pattern]
+            self.invalidate_pattern_table()
         except KeyError:
             log.info('[%s] failed to delete patternMap[%s] entry [%s]: item not found' % (self.name, state, pattern))
 
@@ -1261,31 +1913,345 @@ class Device:
 # end Device class
 
 
+class PendingOperation:
+    '''
+    A device operation requested to an :py:class:`AsyncDevice`.
+    
+    The operation runs when it is awaited or, if it was requested by a synchronous action that cannot await it,
+    when the device flushes its pending operations.
+    '''
+    
+    def __init__(self, device, coroutine):
+        self.device = device
+        self.coroutine = coroutine
+        device.pendingOps.append(self)
+        
+    def __await__(self):
+        return self.run().__await__()
+    
+    async def run(self):
+        device = self.device
+        if self in device.pendingOps:
+            device.pendingOps.remove(self)
+            
+        # the operations requested while running belong to this operation
+        outerOps = device.pendingOps
+        device.pendingOps = []
+        try:
+            result = await self.coroutine
+            await device.flush()
+            return result
+        except BaseException:
+            # like a synchronous action the operations following a failure are not executed
+            for op in outerOps:
+                op.cancel()
+            outerOps = []
+            raise
+        finally:
+            device.pendingOps = outerOps
+            
+    def cancel(self):
+        self.coroutine.close()
+
+
+class AsyncDevice(Device):
+    '''
+    A `Device` driven by an asyncio event loop.
+    
+    The FSM and the driver events are the same of `Device`, but :py:meth:`login` and :py:meth:`send` are coroutines
+    that wait for the device output without blocking the loop thread::
+    
+     async def poll(urls):
+         devices = [async_device(url) for url in urls]
+         return await asyncio.gather(*[d.send('show version') for d in devices])
+    
+    The actions are plain functions: when an action calls :py:meth:`send_line`, :py:meth:`send`, :py:meth:`expect` or :py:meth:`clear_buffer`
+    the operation is queued and executed, in the requested order, as soon as the action returns.
+    '''
+    
+    def __init__(self, name, driver=None, username = None, password = None, protocol='ssh', port=22, hops = []):
+        self.pendingOps = []
+        Device.__init__(self, name, driver, username, password, protocol, port, hops)
+        
+    def __repr__(self):
+        return 'async-device:' + self.name
+
+    async def flush(self):
+        '''
+        Run the pending operations requested by the actions
+        '''
+        while self.pendingOps:
+            await self.pendingOps[0]
+
+    def close(self):
+        for op in self.pendingOps:
+            op.cancel()
+        self.pendingOps = []
+        Device.close(self)
+
+    def probe_prompt(self):
+        '''
+        The actions cannot wait for the probes answers: the async devices use the tentative prompt rounds
+        '''
+        return False
+
+    async def ssh_master_alive(self):
+        '''
+        The ``ssh -O check`` of the master connection runs without blocking the event loop
+        '''
+        import asyncio
+        (path, alive) = self.cached_ssh_master()
+        if alive is None:
+            check = await asyncio.create_subprocess_exec('ssh', '-O', 'check', '-S', path, self.name,
+                                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            alive = self.ssh_master_checked(path, await check.wait())
+        return alive
+
+    async def login(self):
+        """
+        open a network connection using protocol. Currently supported protocols are telnet and ssh.
+        If login has succeeded the device is in USER_PROMPT state and it is ready for consuming commands
+        """
+        from pyco.expectsession import AsyncExpectSession
+        log.debug("%s async login ..." % self.name)
+        self.esession = AsyncExpectSession(self.hops,self)
+        self.currentEvent = internedEvent('do-nothing-event')
+        
+        try:
+            await self.esession.login()
+        except ExpectException as e:
+            log.info("[%s]: in login phase got [%s] error" % (e.device.name ,e.__class__))
+            log.debug("interaction log tail: [%s]" % e.interaction_log)
+            raise e
+            
+        await self.clear_buffer()
+        
+        if self.state == 'GROUND' or self.currentEvent.isTimeout():
+            raise LoginFailed(self, 'unable to connect: %s' % self.currentEvent.name)
+        else:
+            log.debug("%s logged in !!! ..." % self.name)
+
+    def expect(self, checkPoint):
+        return PendingOperation(self, self.esession.patternMatch(self, checkPoint, [], self.maxWait))
+
+    def send_line(self, stringValue):
+        """
+        send ``stringValue`` to the device CLI, the returned operation completes when the string is written
+        """
+        return PendingOperation(self, self.async_send_line(stringValue))
+
+    async def async_send_line(self, stringValue):
+        log.debug('generating event [%s]' % stringValue)
+        
+        self.process(events.get(stringValue) or Event(stringValue))
+        await self.flush()
+        
+        log.debug("[%s] sending [%s]" % (self, stringValue))
+        self.esession.send_line(stringValue)
+
+    def send(self, script_or_template, param_map=None):
+        '''
+        Send the template script or a plain script to the device, the returned operation completes with the command output.
+        
+        See :py:meth:`pyco.device.Device.send` 
+        '''
+        return PendingOperation(self, self.async_send(script_or_template, param_map))
+
+    async def async_send(self, script_or_template, param_map=None):
+        if self.state == 'GROUND':
+            await self.login()
+
+        command = self.render_script(script_or_template, param_map)
+        return joinLineOutputs([lineOut async for lineOut in self.process_lines(command.split('\n'))])
+
+    async def process_lines(self, lines):
+        if self.pipelining():
+            async for lineOut in self.process_pipelined_lines(lines):
+                yield lineOut
+        else:
+            for line in lines:
+                log.debug('[%s]: sending line [%s]' % (self.name, line))
+                yield await self.process_single_line(line)
+
+    async def process_pipelined_lines(self, lines):
+        '''
+        See :py:meth:`pyco.device.Device.process_pipelined_lines`
+        '''
+        for (pipelined, line) in self.pipeline_window(lines):
+            for sent in pipelined:
+                await self.send_line(sent)
+            
+            out = await self.esession.processResponse(self, runUntilPromptMatchOrTimeout)
+            self.prompt_timeout(out)
+            
+            yield self.strip_command(line, out)
+
+    async def process_single_line(self, command):
+        '''
+        Send the command string to the device and return the command output.
+
+        See :py:meth:`pyco.device.Device.process_single_line` 
+        '''
+        if self.marker_enabled():
+            (marker, markerCommand) = self.completion_marker()
+            await self.send_line(command)
+            self.esession.send_line(markerCommand)
+            
+            chunks = [await self.esession.processResponse(self, runUntilOutputCompleteOrTimeout, self.marker_patterns())]
+            while not self.marker_matched(marker):
+                chunks.append(await self.esession.processResponse(self, runUntilOutputCompleteOrTimeout, self.marker_patterns()))
+                
+            if self.currentEvent.name == 'output_complete':
+                await self.esession.processResponse(self, runUntilPromptMatchOrTimeout)
+            out = self.strip_marker(''.join(chunks), marker, markerCommand)
+        else:
+            await self.send_line(command)
+            out = await self.esession.processResponse(self, runUntilPromptMatchOrTimeout)
+        
+        if self.prompt_timeout(out):
+            # run the operations of the discovery actions
+            await self.flush()
+
+        if self.recheck_output():
+            log.debug("Checking if [%s] response [%s] is complete" % (command,out))
+            chunks = [out]
+            currOut = None
+            while currOut != '':
+                await self.clear_buffer()
+                currOut = await self.esession.processResponse(self, runUntilPromptMatchOrTimeout)
+                chunks.append(currOut)
+                log.debug("Rechecking if [%s] response is complete, got [%s]" % (command,currOut))
+            out = ''.join(chunks)
+        
+        return self.strip_command(command, out)
+
+    def clear_buffer(self):
+        return PendingOperation(self, self.async_clear_buffer())
+
+    async def async_clear_buffer(self):
+        # the blocking devices do not import asyncio
+        import asyncio
+        log.debug('clearing buffer ...')
+        
+        try:
+            if self.quietPeriod:
+                await self.esession.wait_quiescence(self.quietPeriod, self.waitBeforeClearingBuffer)
+            else:
+                await asyncio.sleep(self.waitBeforeClearingBuffer)
+            await self.esession.expect(['.*'], [ANY_OUTPUT], 1)
+        except Exception as e:
+            log.debug("[%s] clear_buffer timeout: cleared expect buffer (%s)" % (self.name, e.__class__))
+            log.debug(e)
+
+# end AsyncDevice class
+
+
 def loadConfiguration(cfgfile=cfgFile):
     '''
-    Load the pyco configuration file
+    Load the pyco configuration file and return its ConfigObj.
+
+    If the snapshots are enabled the validated configuration is saved into a snapshot, see installConfiguration().
     '''
     
     import os.path
     if os.path.isfile(cfgfile):
     #try:
-        config = ConfigObj(cfgfile, configspec=resource_filename('pyco', 'cfg/pyco_spec.cfg'))
-        return reload(config)
+        from configobj import ConfigObj #@UnresolvedImport
+        config = ConfigObj(cfgfile, configspec=specFile)
+        reload(config)
+        if snapshotsEnabled:
+            writeSnapshot(snapshotPath(cfgfile), config.dict(), snapshotPrefix(cfgfile))
+        return config
     else:
         raise Exception('pyco configuration file not found: ' + cfgfile)
     #except:
     #    raise Exception('pyco configuration file not found: ' + cfgfile)
 
 
+def installConfiguration(cfgfile=cfgFile):
+    '''
+    Set the drivers attributes from the pyco configuration file, when pyco is imported.
+
+    If the PYCO_SNAPSHOTS environment variable is set, the validated configuration is saved into a snapshot keyed
+    by the hash of the configuration and specification files: the following imports read the snapshot, skipping
+    the parsing and the validation.
+    '''
+    if snapshotsEnabled and os.path.isfile(cfgfile):
+        config = readSnapshot(snapshotPath(cfgfile))
+        if config is not None:
+            reset()
+            install(config)
+            return
+    loadConfiguration(cfgfile)
+
+
+def snapshotPath(cfgfile):
+    '''
+    The snapshot of the configuration file, named by the hash of the file path and by the hash of the contents:
+    the python version is part of the contents key because the marshal format may change
+    '''
+    digest = hashlib.sha1(sys.version.encode())
+    for f in [cfgfile, specFile]:
+        with open(f, 'rb') as fp:
+            digest.update(fp.read())
+    return os.path.join(snapshotDir, '%s%s.snapshot' % (snapshotPrefix(cfgfile), digest.hexdigest()))
+
+
+def snapshotPrefix(cfgfile):
+    '''
+    The name prefix shared by all the snapshots of the configuration file
+    '''
+    return 'pyco-%s-' % hashlib.sha1(os.path.abspath(cfgfile).encode()).hexdigest()[:12]
+
+
+def readSnapshot(path):
+    try:
+        with open(path, 'rb') as fp:
+            config = marshal.load(fp)
+        log.debug("loaded configuration snapshot [%s]" % path)
+        return config
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        log.debug("configuration snapshot [%s] not available: %s" % (path, e))
+        return None
+
+
+def writeSnapshot(path, config, prefix):
+    '''
+    Save the validated configuration, a dictionary of plain values: the file is renamed when complete,
+    so that the concurrent processes never read a partial snapshot.
+    The snapshots with the same prefix, superseded by the new one, are removed
+    '''
+    try:
+        os.makedirs(snapshotDir, exist_ok=True)
+        (fd, tmp) = tempfile.mkstemp(dir=snapshotDir, prefix='.pyco-')
+    except OSError as e:
+        log.debug("unable to save configuration snapshot [%s]: %s" % (path, e))
+        return
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            marshal.dump(config, fp)
+        os.replace(tmp, path)
+    except (OSError, ValueError) as e:
+        log.debug("unable to save configuration snapshot [%s]: %s" % (path, e))
+        os.unlink(tmp)
+        return
+    for f in os.listdir(snapshotDir):
+        if f.startswith(prefix) and f != os.path.basename(path):
+            try:
+                os.unlink(os.path.join(snapshotDir, f))
+                log.debug("removed superseded configuration snapshot [%s]" % f)
+            except OSError as e:
+                log.debug("unable to remove configuration snapshot [%s]: %s" % (f, e))
+
+
 def load(config):
     '''
     Load the pyco configObj
     '''
-    global configObj
-    
-    pyco_spec = resource_filename('pyco', 'cfg/pyco_spec.cfg')
-    
-    config.configspec = ConfigObj(pyco_spec)
+    from configobj import ConfigObj, flatten_errors #@UnresolvedImport
+    from validate import Validator #@UnresolvedImport
+
+    config.configspec = ConfigObj(specFile)
     
     val = Validator()
     results = config.validate(val)
@@ -1297,25 +2263,33 @@ def load(config):
             else:
                 raise ConfigFileError('The following section was missing:%s ' % ', '.join(section_list))
     
+    return install(config)
+
+
+def install(config):
+    '''
+    Set the drivers attributes from the validated configuration
+    '''
+    global configObj
+    
     configObj = config
     
     for section in list(config.keys()):
-        for (key,value) in list(config[section].items()):
-            if value is None:
-                log.debug("skipping [%s.%s] undefined value" % (section, key))
-                continue
-            
-            try:
-                driver = Driver.get(section)
-                if key in ['events', 'transitions']:
-                    continue
-            except DriverNotFound:
-                log.debug("creating driver [%s]" % section)
-                driver = driverBuilder(section)
-                
-            log.debug("setting [%s.%s] = [%s]" % (driver,key,value))
-            setattr(driver, key, value)
-    
+        try:
+            driver = Driver.get(section)
+        except DriverNotFound:
+            log.debug("creating driver [%s]" % section)
+            driver = driverBuilder(section)
+
+        # the undefined values are inherited from the parent driver
+        values = dict([(key, value) for (key, value) in config[section].items() 
+                       if value is not None and key not in ['events', 'transitions']])
+        log.debug("setting [%s] attributes %s" % (driver, values))
+        driver.__dict__.update(values)
+
+    Driver.flatten()
+    Driver.compiled.clear()
+    invalidate_actions()
     return config       
 
 
@@ -1335,18 +2309,21 @@ def reset():
         return;
     
     for section in list(configObj.keys()):
-        for (key,value) in list(configObj[section].items()):
-            log.debug("deleting %s.%s (was %s)" % (section, key, value))
-           
-            try:
-                driver = Driver.get(section)
-                if key not in ['events', 'transitions']:
-                    try:
-                        delattr(driver, key)
-                    except AttributeError:
-                        log.debug("[%s] attribute [%s] not found (not directly defined?)" % (section,key))
-            except DriverNotFound:
-                log.error('configuration reset error: [%s] driver not found' % section)
+        try:
+            driver = Driver.get(section)
+        except DriverNotFound:
+            log.error('configuration reset error: [%s] driver not found' % section)
+            continue
+
+        log.debug("deleting [%s] attributes" % section)
+        for key in configObj[section]:
+            if key not in ['events', 'transitions']:
+                # the undefined values were not set
+                driver.__dict__.pop(key, None)
+
+    Driver.flatten()
+    Driver.compiled.clear()
+    invalidate_actions()
             
                     
 
@@ -1380,12 +2357,17 @@ class Driver:
 
     registry = {}
 
+    # driver name --> CompiledFsm, cleared when the configuration changes
+    compiled = {}
+
     def __init__(self, name):
 
         """This creates the Driver. You set the initial state here. The "memory"
         attribute is any object that you want to pass along to the action
         functions. It is not used by the Driver. For parsing you would typically
         pass a list to be used as a stack. """
+        # the flattened view of the driver attributes, including the ones inherited from the parent drivers
+        self.__dict__['settings'] = {}
         self.name = name
 
 
@@ -1397,16 +2379,54 @@ class Driver:
         return 'driver:' + self.name
 
     def __getattr__(self, attrname):
-        if attrname == 'parent':
+        # the parent drivers are not searched: their attributes are already flattened into settings
+        try:
+            return self.__dict__['settings'][attrname]
+        except KeyError:
             raise AttributeError(attrname)
-        else:
-            #log.debug("[%s] delegating search for [%s] to [%s]" % (self, attrname, self.parent))
-            try:
-                pDriver = Driver.get(self.parent)
-                return getattr(pDriver, attrname)
-            except AttributeError:
-                raise AttributeError(attrname)
-            
+
+    def __setattr__(self, attrname, value):
+        self.__dict__[attrname] = value
+        Driver.flatten()
+
+    def __delattr__(self, attrname):
+        del self.__dict__[attrname]
+        Driver.flatten()
+
+    @staticmethod
+    def flatten():
+        '''
+        Rebuild the settings of all the drivers: a driver inherits the attributes of its parent,
+        except the parent itself. A missing parent is skipped, it is found by the next rebuild.
+        '''
+        done = {}
+
+        def settings(driver, path):
+            if driver.name in done:
+                return done[driver.name]
+            values = {}
+            parent = driver.__dict__.get('parent')
+            if parent in Driver.registry and parent not in path:
+                values.update(settings(Driver.registry[parent], path + [driver.name]))
+                values.pop('parent', None)
+            values.update(driver.__dict__)
+            del values['settings']
+            driver.__dict__['settings'] = done[driver.name] = values
+            return values
+
+        for driver in list(Driver.registry.values()):
+            settings(driver, [])
+
+    def compiled_fsm(self):
+        '''
+        Return the FSM tables of the driver, compiled from the configuration on the first request
+        '''
+        try:
+            return Driver.compiled[self.name]
+        except KeyError:
+            fsm = CompiledFsm(self)
+            Driver.compiled[self.name] = fsm
+            return fsm
 
     @staticmethod
     def get(driverName):
@@ -1418,24 +2438,100 @@ class Driver:
     @staticmethod
     def addDriver(driver):
         Driver.registry[driver.name] = driver
+        Driver.flatten()
         
-  
-try:
-    from sqlalchemy import create_engine #@UnresolvedImport
-    from sqlalchemy import Column #@UnresolvedImport
-    from sqlalchemy import String #@UnresolvedImport
+
+
+class CompiledFsm:
+    '''
+    The FSM tables built from the configuration of a driver, shared read only by all the devices of the driver.
+
+    A device copies the tables the first time it changes them, see :py:meth:`Device.own_fsm`.
+    The compiled patterns table is a cache filled on demand and it is shared too.
+    '''
+
+    def __init__(self, driver):
+        log.debug("compiling [%s] FSM" % driver)
+        self.name = driver.name
+        self.driver = driver
+
+        self.state_transitions = {}
+        self.state_transitions_any = {}
+        self.input_transitions_any = {}
+        self.default_transition = None
+        self.patternMap = {'*':{}}
+        self.patternTable = {}
+
+        buildPatternsList(self)
+        setDefaultTransition(self, defaultEventHandler, None)
+
+        self.state_transitions = MappingProxyType(self.state_transitions)
+        self.state_transitions_any = MappingProxyType(self.state_transitions_any)
+        self.input_transitions_any = MappingProxyType(self.input_transitions_any)
+        self.patternMap = MappingProxyType(dict([(state, MappingProxyType(patterns)) for (state, patterns) in self.patternMap.items()]))
+
+        # the dense transition table, built by the first device that enables it
+        self.transitionIndex = None
+
+
+class TransitionTable:
+    '''
+    The transitions compiled into a dense table indexed by the state id and the event id, see :py:func:`symbol`.
+
+    Every cell holds the transition selected by :py:meth:`Device.get_transition`, with the fallbacks to the
+    any-input, any-state and default transitions already applied: the last cell of a row is the transition of
+    the events interned after the compilation. The `anyState` row is used for the states without transitions.
+    '''
+    __slots__ = ('rows', 'anyState', 'width', 'default')
+
+    def __init__(self, state_transitions, state_transitions_any, input_transitions_any, default_transition):
+        width = len(symbols)
+        self.width = width
+        self.default = default_transition
+
+        self.anyState = [input_transitions_any.get(eventId, default_transition) for eventId in range(width)] + [default_transition]
+        self.rows = [self.anyState] * width
+        for stateId in set([key & 0xffffffff for key in state_transitions]) | set(state_transitions_any):
+            if stateId in state_transitions_any:
+                self.rows[stateId] = [state_transitions_any[stateId]] * (width + 1)
+            else:
+                self.rows[stateId] = list(self.anyState)
+        for (key, transition) in state_transitions.items():
+            self.rows[key & 0xffffffff][key >> 32] = transition
+
+    def get(self, eventId, stateId):
+        '''
+        Return the (action, next_state) transition or None if undefined
+        '''
+        if stateId is not None and stateId < self.width:
+            row = self.rows[stateId]
+        else:
+            row = self.anyState
+        if eventId is not None and eventId < self.width:
+            return row[eventId]
+        return row[-1]
+
+
+# the prompt cache needs the sqlalchemy, zope.sqlalchemy and transaction packages, imported only when the cache is opened
+sql_powered = all([importlib.util.find_spec(m) is not None for m in ['sqlalchemy', 'zope.sqlalchemy', 'transaction']])
+
+engine = None
+DBSession = None
+promptCache = None
+
+# the sqlalchemy mapped class of the cached prompts, declared when the cache is opened
+DevicePrompt = None
+
+
+def declarePromptModel():
+    '''
+    Declare the device_prompt table
+    '''
+    from sqlalchemy import Column, String #@UnresolvedImport
     from sqlalchemy.ext.declarative import declarative_base #@UnresolvedImport
-    from sqlalchemy.orm import scoped_session #@UnresolvedImport
-    from sqlalchemy.orm import sessionmaker #@UnresolvedImport
-    from zope.sqlalchemy import ZopeTransactionExtension #@UnresolvedImport
-    import transaction #@UnresolvedImport
-    import logging
-    
-    logging.basicConfig()
-    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARN)
-   
+
     Base = declarative_base()
-    
+
     class DevicePrompt(Base):
         __tablename__ = 'device_prompt'
         
@@ -1447,97 +2543,180 @@ try:
             self.device = device
             self.state = state
             self.prompt = prompt
-    
-    def initialize_sql():
-        Base.metadata.bind = engine
-        Base.metadata.create_all(engine)
 
-    
-    def createDB(url):
-        log.debug('db endpoint: [%s]' % url)
+    return DevicePrompt
+
+
+def initialize_sql():
+    DevicePrompt.metadata.bind = engine
+    DevicePrompt.metadata.create_all(engine)
+
+
+def db_url():
+    import os.path
+    if hasattr(pyco, 'pyco_home'):
+        db_url = 'sqlite:///%s/%s' % (pyco.pyco_home, configObj['common']['cache'])
+    else:
+        db_url = 'sqlite:////tmp/%s' % configObj['common']['cache']
+    return db_url
+
+def cache_enabled():
+    return DBSession != None
+
+
+def load_prompt(name, state):
+    '''
+    Read the prompt of the device state from the sqlite store
+    '''
+    session = DBSession()
+    try:
+        prompt = session.query(DevicePrompt).get((name, state))
+        return prompt.prompt if prompt else None
+    finally:
+        session.close()
+
+def store_prompts(prompts, evicted):
+    '''
+    Write the prompts and delete the evicted ones from the sqlite store with a single transaction
+    '''
+    table = DevicePrompt.__table__
+    with engine.begin() as connection:
+        if prompts:
+            connection.execute(table.insert().prefix_with('OR REPLACE'),
+                               [{'device': name, 'state': state, 'prompt': value} for ((name, state), value) in prompts.items()])
+        for (name, state) in evicted:
+            connection.execute(table.delete().where(table.c.device == name).where(table.c.state == state))
+
+def set_sqlite_pragma(connection, record):
+    '''
+    The write ahead log lets the readers access the database while a writer commits
+    '''
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+def open_cache(url):
+    '''
+    Open the prompt cache database shared by the pyco processes.
+
+    The connections wait at most `cacheBusyTimeout` seconds for the lock held by the writer of another process
+    '''
+    global engine, DBSession, promptCache, DevicePrompt
+
+    import logging
+    from sqlalchemy import create_engine, event #@UnresolvedImport
+    from sqlalchemy.pool import QueuePool #@UnresolvedImport
+    from sqlalchemy.orm import scoped_session, sessionmaker #@UnresolvedImport
+    from zope.sqlalchemy import ZopeTransactionExtension #@UnresolvedImport
+
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARN)
+    if DevicePrompt is None:
+        DevicePrompt = declarePromptModel()
+
+    log.debug('creating engine for [%s]' % url)
+    common = configObj['common']
+    # the pool hands out a connection to a thread at a time
+    engine = create_engine(url, echo=False, poolclass=QueuePool,
+                           connect_args={'timeout': common['cacheBusyTimeout'], 'check_same_thread': False})
+    event.listen(engine, 'connect', set_sqlite_pragma)
+
+    DBSession = scoped_session(sessionmaker(
+                             extension=ZopeTransactionExtension(), bind=engine))
+    try:
         initialize_sql()
-        
-    def db_url():
-        import os.path
-        if hasattr(pyco, 'pyco_home'):
-            db_url = 'sqlite:///%s/%s' % (pyco.pyco_home, configObj['common']['cache'])
-        else:
-            db_url = 'sqlite:////tmp/%s' % configObj['common']['cache']
-        return db_url
-    
-    def cache_enabled():
-        return DBSession != None
-    
-    def cache_exists():
-        import os.path
-        if hasattr(pyco, 'pyco_home'):
-            db_file = '%s/%s' % (pyco.pyco_home, configObj['common']['cache'])
-        else:
-            db_file = '/tmp/%s' % configObj['common']['cache']
-        try:
-            if configObj['common']['cache']:
-                if not os.path.isfile(db_file):
-                    log.debug('creating cache [%s] ...' % db_file)
-                    createDB('sqlite://%s' % db_file)
-        except Exception as e:
-            log.info('prompt cache is not enabled: %s' % e)
-    
-    
-    def get_cached_prompt(target):
-        log.debug('[%s] state [%s]: getting cached prompt' % (target.name, target.state))
-        try:
-            session = DBSession()
-            prompt = session.query(DevicePrompt).get((target.name,target.state))
-            session.close()
-            return prompt
-        except Exception as e:
-            log.debug('no prompt cached: %s' % e)
-            return None
-    
-    def save_cached_prompt(target):
-        log.debug('[%s] state [%s]: caching prompt [%s]' % (target.name, target.state, target.prompt[target.state].value))
-        try:
-            session = DBSession()
-            
-            transaction.begin()
-            prompt = session.query(DevicePrompt).get((target.name,target.state))
-            if prompt:
-                prompt.prompt = target.prompt[target.state].value
-            else:
-                
-                log.debug('adding a new prompt to cache')
-                prompt = DevicePrompt(target.name, target.state, target.prompt[target.state].value)
-                session.add(prompt)
-            transaction.commit()
-    
-            #session.close()
-        except Exception as e:
-            log.error('no prompt saved: %s' % e)
-            
-    sql_powered = True
-except:
-    logging.exception("unable to load sql pluging for caching prompts")
-    
-    sql_powered = False
-    
-    def cache_enabled():
-        return False
+    except Exception as e:
+        # another process is creating the table
+        log.debug('prompt cache initialization: %s' % e)
+
+    promptCache = PromptCache(load_prompt, store_prompts, common['cacheSize'], common['cacheFlushInterval'])
+
+def preload_prompts(names):
+    '''
+    Warm the prompt cache with the stored prompts of the `names` devices, querying the store
+    with a few bulk selects instead of a lookup for every device at login time.
+    Return the number of prompts loaded.
+    '''
+    names = list(names)
+    prompts = {}
+    session = DBSession()
+    try:
+        # keep the query parameters below the sqlite limit
+        for start in range(0, len(names), 500):
+            for p in session.query(DevicePrompt).filter(DevicePrompt.device.in_(names[start:start + 500])):
+                prompts[(p.device, p.state)] = p.prompt
+    finally:
+        session.close()
+    log.debug('preloaded [%d] prompts of [%d] devices' % (len(prompts), len(names)))
+    promptCache.warm(prompts)
+    return len(prompts)
+
+def open_dump(path, mode):
+    if path.endswith('.gz'):
+        import gzip
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def export_prompts(path):
+    '''
+    Write the stored prompts to the `path` file, a json list ``[device, state, prompt]`` for every line,
+    compressed if `path` ends with ``.gz``. Return the number of prompts exported.
+    '''
+    import json
+    promptCache.flush()
+    count = 0
+    session = DBSession()
+    try:
+        with open_dump(path, 'w') as dump:
+            for p in session.query(DevicePrompt).order_by(DevicePrompt.device, DevicePrompt.state).yield_per(1000):
+                dump.write(json.dumps([p.device, p.state, p.prompt]) + '\n')
+                count += 1
+    finally:
+        session.close()
+    log.debug('exported [%d] prompts to [%s]' % (count, path))
+    return count
+
+def import_prompts(path):
+    '''
+    Store the prompts of a file written by :py:func:`export_prompts`, replacing the prompts already stored,
+    with a single transaction. Return the number of prompts imported.
+    '''
+    import json
+    prompts = {}
+    with open_dump(path, 'r') as dump:
+        for line in dump:
+            if line.strip():
+                (name, state, prompt) = json.loads(line)
+                prompts[(name, state)] = prompt
+    store_prompts(prompts, set())
+    promptCache.warm(prompts)
+    log.debug('imported [%d] prompts from [%s]' % (len(prompts), path))
+    return len(prompts)
+
+def get_cached_prompt(target):
+    log.debug('[%s] state [%s]: getting cached prompt' % (target.name, target.state))
+    return promptCache.get(target.name, target.state)
+
+def save_cached_prompt(target):
+    log.debug('[%s] state [%s]: caching prompt [%s]' % (target.name, target.state, target.prompt[target.state].value))
+    promptCache.put(target.name, target.state, target.prompt[target.state].value)
+
+def evict_cached_prompt(target, prompt):
+    promptCache.evict(target.name, target.state, prompt)
     
     
 # finally and only finally load the configuration
-loadConfiguration()     
+installConfiguration()     
 
 
-if sql_powered:
-    DBSession = None
-    if 'cache' in configObj['common']:
-        log.debug('creating engine for [%s]' % db_url())
-        engine = create_engine(db_url(), echo=False)
-
-        DBSession = scoped_session(sessionmaker(
-                                 extension=ZopeTransactionExtension(), bind=engine))
-    
-        cache_exists()
+if 'cache' in configObj['common']:
+    if sql_powered:
+        try:
+            open_cache(db_url())
+        except Exception as e:
+            log.error("unable to open the prompt cache: %s" % e)
+    else:
+        log.info("prompt cache disabled: the sqlalchemy, zope.sqlalchemy and transaction packages are not installed")
 
 
 if __name__ == "__main__":
@@ -4,14 +4,20 @@ Created on Feb 21, 2011
 @author: adona
 '''
 import sys
-import io #@UnresolvedImport
+import time
 if sys.platform != 'win32':
-    from pexpect import spawnu, TIMEOUT, EOF #@UnresolvedImport
+    from pexpect import spawnu, TIMEOUT, EOF, __version__ as pexpectVersion #@UnresolvedImport
+    from pexpect.expect import Expecter, searcher_re, searcher_string #@UnresolvedImport
+    # since pexpect 4.7 the unmatched output is kept into the _before and _buffer buffers of the spawn,
+    # before the output is the buffer string attribute: see read_lines
+    bufferedSpawn = tuple([int(v) for v in pexpectVersion.split('.')[:2]]) >= (4, 7)
 else:
     from winpexpect import winspawnu as spawnu, TIMEOUT, EOF #@UnresolvedImport
+    bufferedSpawn = False
 
     
-from pyco.device import Event, device, ConnectionTimedOut #@UnresolvedImport
+from pyco.device import internedEvent, device, ConnectionTimedOut, ConnectionRefused #@UnresolvedImport
+from pyco.interactionlog import interactionLog
 from pyco import log
 
 
@@ -40,8 +46,18 @@ class ExpectSession:
     def __init__(self, hops, target):
         self.hops = hops + [target]
 
-        # in memory log
-        self.logfile = io.StringIO()
+        # continue the session left at the prompt of the last connected hop by a previous target
+        connected = [h for h in hops if h.is_connected() and hasattr(h, 'esession') and hasattr(h.esession, 'pipe')]
+        if connected:
+            upstream = connected[-1].esession
+            log.debug("[%s] reusing the session connected to [%s]" % (target.name, connected[-1].name))
+            self.pipe = upstream.pipe
+            self.logfile = upstream.logfile
+            for h in connected:
+                h.esession = self
+        else:
+            # the log of the characters exchanged with the devices
+            self.logfile = interactionLog(target.interactionLog, target.interactionLogSize)
 
         # key is a hop object, value is the hop fsm current state
         #self.currentState = {}
@@ -59,6 +75,41 @@ class ExpectSession:
         if hasattr(self, 'pipe'):    
             self.pipe.close(force=True)
             del self.pipe
+
+        # the whole path is disconnected
+        for hop in self.hops[:-1]:
+            hop.loggedin = False
+            hop.state = 'GROUND'
+
+    def return_to_hop(self, target):
+        """
+        Logout from the target and wait for the prompt of the previous hop, keeping open the
+        connection to the hop for the next target of the path.
+
+        Return False if the hop prompt is unknown or it is not matched within the hop maxWait time:
+        the caller has to close the whole session.
+        """
+        if len(self.hops) < 2 or not hasattr(self, 'pipe'):
+            return False
+        hop = self.hops[-2]
+        if not hop.is_connected() or hop.state not in hop.prompt:
+            return False
+
+        prompt = hop.get_prompt()
+        log.debug("[%s] returning to [%s] prompt [%s]" % (target.name, hop.name, prompt))
+        self.send_line(target.exitCommand)
+        try:
+            if hasattr(hop, 'promptPattern') and prompt == hop.promptPattern:
+                # the configured prompt is a regular expression, the discovered prompts are literals
+                self.pipe.expect(prompt, hop.maxWait)
+            else:
+                self.pipe.expect_exact(prompt, hop.maxWait)
+        except (TIMEOUT, EOF):
+            log.info("[%s] [%s] prompt not found after logout" % (target.name, hop.name))
+            return False
+
+        self.currentHop = hop
+        return True
         
     def connect(self, position):
         """
@@ -95,11 +146,32 @@ class ExpectSession:
         if hasattr(self, 'pipe'):
             self.send_line(cmd)
         else:
-            # TODO: close the spawnued session
+            multiplexed = target.ssh_master_alive()
+            self.spawn(target, cmd)
+            if multiplexed:
+                target.skip_authentication()
+        self.processResponse(target, loginSuccessfull)
+
+    def spawn(self, target, cmd):
+        """
+        Open the pipe to the first hop of the path.
+
+        The pipe is the pexpect child executing the connect command or, if the target driver
+        sets ``transport = native``, a telnet connection managed inside the process.
+        """
+        if target.protocol == 'telnet' and target.transport == 'native':
+            from pyco.telnet import TelnetSpawn
+            log.debug("[%s]: opening a native telnet session to port [%s] ..." % (target, target.port))
+            try:
+                self.pipe = TelnetSpawn(target.name, target.port, target.maxWait, logfile=self.logfile)
+            except ConnectionRefusedError as e:
+                raise ConnectionRefused(target, str(e))
+            except OSError as e:
+                raise ConnectionTimedOut(target, 'unable to connect: %s' % e)
+        else:
             # send the connect string to pexpect
             log.debug("[%s]: spawning a new [%s] session ..." % (target, cmd)) 
             self.pipe = spawnu(cmd, logfile=self.logfile)
-        self.processResponse(target, loginSuccessfull)
 
     def send_line(self, command):
         """
@@ -109,70 +181,381 @@ class ExpectSession:
         self.pipe.sendline(command)
  
         
+    def wait_quiescence(self, quietPeriod, maxWaitTime):
+        """
+        Consume the device output until no character arrives for `quietPeriod` seconds or
+        `maxWaitTime` seconds are elapsed
+        """
+        deadline = time.time() + maxWaitTime
+        while True:
+            timeLeft = deadline - time.time()
+            if timeLeft <= 0:
+                return
+            try:
+                self.pipe.read_nonblocking(self.pipe.maxread, min(quietPeriod, timeLeft))
+            except TIMEOUT:
+                return
+
+    def read_until(self, complete, quietPeriod, maxWaitTime):
+        """
+        Read and return the device output, bypassing the expect buffer, until `complete(output)` is True
+        and no more character arrives for `quietPeriod` seconds, or `maxWaitTime` seconds are elapsed
+        """
+        chunks = []
+        deadline = time.time() + maxWaitTime
+        while True:
+            timeLeft = deadline - time.time()
+            if timeLeft <= 0:
+                break
+            wait = min(quietPeriod, timeLeft) if complete(''.join(chunks)) else timeLeft
+            try:
+                chunks.append(self.pipe.read_nonblocking(self.pipe.maxread, wait))
+            except (TIMEOUT, EOF):
+                break
+        return ''.join(chunks)
+
+    def expect(self, patterns, compiled, maxWaitTime, exactMatch=False, searcher=None):
+        """
+        Wait until one of the patterns matches the device output and return the matched index.
+        
+        `compiled` is the list of the precompiled `patterns` regular expressions.
+        If `searcher` is defined it is used for matching in place of the patterns lists.
+        """
+        if searcher is not None:
+            return self.pipe.expect_loop(searcher, maxWaitTime)
+        elif exactMatch:
+            return self.pipe.expect_exact(patterns, maxWaitTime)
+        else:
+            return self.pipe.expect_list(compiled, maxWaitTime)
+
+    def set_event(self, target, patterns, index, searcher=None):
+        """
+        Set the target current event from the index of the matched pattern
+        """
+        try:
+            if searcher is not None and index != searcher.timeout_index:
+                # the alternation searcher already knows the event
+                target.currentEvent = internedEvent(searcher.event)
+            else:
+                target.currentEvent = internedEvent(target.get_event(patterns[index]))
+        except Exception as e:
+            if patterns[index] == TIMEOUT:
+                log.debug("[%s]: exception timeout triggered" % target.name)
+                target.currentEvent = internedEvent('timeout')
+            else:
+                log.error("[%s]: event not registered for pattern: [%s]" % (target.name, patterns[index]))
+                raise
+                
+        log.debug("matched [%s] pattern [%s] --> [%s]" % (index, patterns[index], target.currentEvent.name))
+        log.debug("before: [%s] - after: [%s]" % (self.pipe.before, self.pipe.after))
+
+    def dispatch(self, target, chunks):
+        """
+        Invoke the handlers of the target current event, feed the event to the FSM and append the output consumed
+        by the event to the chunks list
+        """
+        if target.has_event_handlers(target.currentEvent):
+            log.debug("[%s] got [%s] event; invoking handlers: [%s]" % (target.name, target.currentEvent.name, target.get_event_handlers(target.currentEvent)))
+            for eh in target.get_event_handlers(target.currentEvent):
+                eh(target)
+       
+        target.process(target.currentEvent)
+        chunks.append(self.pipe.before)
+        if isinstance(self.pipe.after, str) and not target.currentEvent.isPromptMatch():
+            chunks.append(self.pipe.after)
+        
     def patternMatch(self, target, checkPoint, patternsExt, maxWaitTime):
         
-        target.currentEvent = Event('do-nothing-event')
+        target.currentEvent = internedEvent('do-nothing-event')
         log.debug("entering patternMatch, checkpoint is [%s]" % (checkPoint))
         log.debug("exactPatternMatch [%s]" % target.exactPatternMatch)
         
-        response = ''        
+        # the output chunks are joined once the checkpoint is reached
+        chunks = []
         while not (checkPoint (target) or target.currentEvent.isTimeout()):
             
-            patterns = target.patterns(target.state) + patternsExt
+            (patterns, compiled) = target.pattern_table(target.state, patternsExt)
+            searcher = target.alternation_searcher(target.state, patternsExt)
             # expect and match 
             try:
                 log.debug("[%s] matching [%s]" % (target.state, patterns))
-                #log.debug("PRE exp before: [%s] - after: [%s]" % (self.pipe.before, self.pipe.after))
-                if target.exactPatternMatch:
-                    index = self.pipe.expect_exact(patterns, maxWaitTime)
-                else:
-                    index = self.pipe.expect(patterns, maxWaitTime)
-               
-                try:    
-                    target.currentEvent = Event(target.get_event(patterns[index]))
-                except Exception as e:
-                    if patterns[index] == TIMEOUT:
-                        log.debug("[%s]: exception timeout triggered" % target.name)
-                        target.currentEvent = Event('timeout', propagateToFsm = True)
-                    else:
-                        log.error("[%s]: event not registered for pattern: [%s]" % (target.name, patterns[index]))
-                        raise
-                        
-                log.debug("matched [%s] pattern [%s] --> [%s]" % (index, patterns[index], target.currentEvent.name))
-                log.debug("before: [%s] - after: [%s]" % (self.pipe.before, self.pipe.after))
+                index = self.expect(patterns, compiled, maxWaitTime, target.exactPatternMatch, searcher)
+                self.set_event(target, patterns, index, searcher)
             except EOF:
                 log.debug("[%s] connection unexpectedly closed (%s)" % (target.name, self.pipe.before))
-                target.currentEvent = Event('eof')
+                target.currentEvent = internedEvent('eof')
             except TIMEOUT:
                 log.debug("[%s] connection timed out, unmatched output: [%s]" % (target.name, self.pipe.before))
-                target.currentEvent = Event('timeout')
+                target.currentEvent = internedEvent('timeout')
+
+            self.dispatch(target, chunks)
+
+        return ''.join(chunks)
 
-            #log.debug("detected event [%s]" % target.currentEvent)
-            if target.has_event_handlers(target.currentEvent):
-                log.debug("[%s] got [%s] event; invoking handlers: [%s]" % (target.name, target.currentEvent.name, target.get_event_handlers(target.currentEvent)))
-                for eh in target.get_event_handlers(target.currentEvent):
-                    eh(target)
-           
-            stateChanged = target.process(target.currentEvent)
-            response += self.pipe.before
-            if isinstance(self.pipe.after, str) and not target.currentEvent.isPromptMatch():
-                response += self.pipe.after
+    def read_lines(self):
+        """
+        Remove from the expect buffer and return the complete lines received so far.
+        
+        The last partial line is kept into the buffer because a pattern like the prompt or the pager
+        may match there.
+        The pexpect buffers are private: setup.py pins the pexpect major version.
+        """
+        if not bufferedSpawn:
+            data = self.pipe.buffer
+            cut = data.rfind('\n') + 1
+            self.pipe.buffer = data[cut:]
+            return data[:cut]
 
-        return response
+        data = self.pipe._before.getvalue()
+        cut = data.rfind('\n') + 1
+        if cut == 0:
+            return ''
+        for name in ('_before', '_buffer'):
+            buffer = self.pipe.buffer_type()
+            buffer.write(data[cut:])
+            setattr(self.pipe, name, buffer)
+        return data[:cut]
+
+    def streamMatch(self, target, checkPoint, patternsExt, maxWaitTime, chunkSize):
+        """
+        A patternMatch generator that yields the device output while it arrives instead of collecting it.
+        
+        The output not consumed by an event is yielded in chunks of complete lines, so the
+        patterns spanning more than one line match only if the lines arrive all together.
+        """
+        target.currentEvent = internedEvent('do-nothing-event')
+        log.debug("entering streamMatch, checkpoint is [%s]" % (checkPoint))
+        
+        while not (checkPoint (target) or target.currentEvent.isTimeout()):
+            
+            (patterns, compiled) = target.pattern_table(target.state, patternsExt)
+            alternation = target.alternation_searcher(target.state, patternsExt)
+            if alternation is not None:
+                searcher = alternation
+            elif target.exactPatternMatch:
+                searcher = searcher_string(patterns)
+            else:
+                searcher = searcher_re(compiled)
+            
+            deadline = time.time() + maxWaitTime
+            expecter = Expecter(self.pipe, searcher)
+            try:
+                log.debug("[%s] matching [%s]" % (target.state, patterns))
+                index = expecter.existing_data()
+                while index is None:
+                    lines = self.read_lines()
+                    if lines:
+                        yield lines
+                    try:
+                        incoming = self.pipe.read_nonblocking(chunkSize, max(0, deadline - time.time()))
+                    except TIMEOUT as e:
+                        index = expecter.timeout(e)
+                    except EOF as e:
+                        index = expecter.eof(e)
+                    else:
+                        index = expecter.new_data(incoming)
+                self.set_event(target, patterns, index, alternation)
+            except EOF:
+                log.debug("[%s] connection unexpectedly closed (%s)" % (target.name, self.pipe.before))
+                target.currentEvent = internedEvent('eof')
+            except TIMEOUT:
+                log.debug("[%s] connection timed out, unmatched output: [%s]" % (target.name, self.pipe.before))
+                target.currentEvent = internedEvent('timeout')
+            
+            chunks = []
+            self.dispatch(target, chunks)
+            if any(chunks):
+                yield ''.join(chunks)
 
 #    def processResponseWithTimeout(self, target, checkPoint):
 #        patterns = [pexpect.TIMEOUT]
 #        return self.patternMatch(target, checkPoint, patterns, target.maxWait, exactMatch=True)
         
-    def processResponse(self, target, checkPoint):
+    def processResponse(self, target, checkPoint, patternsExt=[TIMEOUT]):
+        '''
+        Match the target output until the checkPoint is reached, `patternsExt` extends the patterns of the target state
+        '''
+        return self.patternMatch(target, checkPoint, patternsExt, target.maxWait)
+
+    def processStream(self, target, checkPoint, chunkSize):
         '''
+        Return a generator of the target output chunks until the checkPoint is reached
         '''
-        return self.patternMatch(target, checkPoint, [TIMEOUT], target.maxWait)
+        return self.streamMatch(target, checkPoint, [TIMEOUT], target.maxWait, chunkSize)
         
         
  
 
 
+class AsyncExpectSession(ExpectSession):
+    '''
+    An ExpectSession that waits for the device output inside an asyncio event loop.
+
+    The FSM is the same of the blocking session: only the read of the device output is
+    replaced by a non blocking read of the pty file descriptor, so that a single event loop
+    may keep busy many sessions at the same time.
+    All the hops of the path have to be :py:class:`pyco.device.AsyncDevice` instances.
+    '''
+
+    async def login(self):
+        await self.connect(len(self.hops)-1)
+
+    def return_to_hop(self, target):
+        """
+        The wait for the hop prompt would block the event loop: the async sessions are always closed
+        """
+        return False
+
+    async def connect(self, position):
+        """
+        Connect to the device in the hops position index
+        """
+        prevPos = position - 1
+        if prevPos < 0:
+            prevDevice = SOURCE_HOST
+        else:
+            prevDevice = self.hops[prevPos]
+
+        target = self.hops[position]
+       
+        log.debug("[%s] prev hop device: [%s]" % (target.name, prevDevice.name))
+        if not prevDevice.is_connected():
+            log.debug("previous hop %s is not connected, activating ..." % prevDevice.name)
+            
+            # backward propagate the session
+            prevDevice.esession = target.esession
+            await self.connect(prevPos)
+            
+        cmd = target.connect_command(prevDevice)
+
+        log.debug("connecting using %s" % cmd)
+        
+        self.currentHop = target
+        
+        if hasattr(self, 'pipe'):
+            self.send_line(cmd)
+        else:
+            multiplexed = await target.ssh_master_alive()
+            self.spawn(target, cmd)
+            # the pexpect send delay is a blocking sleep that would stall all the loop sessions
+            self.pipe.delaybeforesend = None
+            if multiplexed:
+                target.skip_authentication()
+                await target.flush()
+        await self.processResponse(target, loginSuccessfull)
+
+    def wait_readable(self, maxWaitTime):
+        """
+        Return a future that is done with True when the device output is readable
+        """
+        # the blocking sessions do not import asyncio
+        import asyncio
+        loop = asyncio.get_event_loop()
+        readable = loop.create_future()
+        fd = self.pipe.child_fd
+
+        def ready():
+            if not readable.done():
+                readable.set_result(True)
+
+        def cleanup(future):
+            loop.remove_reader(fd)
+
+        loop.add_reader(fd, ready)
+        readable.add_done_callback(cleanup)
+        return asyncio.wait_for(readable, maxWaitTime)
+
+    async def wait_quiescence(self, quietPeriod, maxWaitTime):
+        """
+        Consume the device output until no character arrives for `quietPeriod` seconds or
+        `maxWaitTime` seconds are elapsed
+        """
+        import asyncio
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + maxWaitTime
+        while True:
+            timeLeft = deadline - loop.time()
+            if timeLeft <= 0:
+                return
+            try:
+                await self.wait_readable(min(quietPeriod, timeLeft))
+            except asyncio.TimeoutError:
+                return
+            try:
+                self.pipe.read_nonblocking(self.pipe.maxread, 0)
+            except TIMEOUT:
+                continue
+
+    async def expect(self, patterns, compiled, maxWaitTime, exactMatch=False, searcher=None):
+        """
+        Wait until one of the patterns matches the device output and return the matched index
+        """
+        if searcher is None:
+            if exactMatch:
+                searcher = searcher_string(patterns)
+            else:
+                searcher = searcher_re(compiled)
+        
+        expecter = Expecter(self.pipe, searcher)
+        index = expecter.existing_data()
+        if index is not None:
+            return index
+
+        import asyncio
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + maxWaitTime
+        while True:
+            timeLeft = deadline - loop.time()
+            if timeLeft <= 0:
+                return expecter.timeout()
+            try:
+                await self.wait_readable(timeLeft)
+            except asyncio.TimeoutError as e:
+                return expecter.timeout(e)
+            try:
+                incoming = self.pipe.read_nonblocking(self.pipe.maxread, 0)
+            except EOF as e:
+                return expecter.eof(e)
+            except TIMEOUT:
+                continue
+            index = expecter.new_data(incoming)
+            if index is not None:
+                return index
+
+    async def patternMatch(self, target, checkPoint, patternsExt, maxWaitTime):
+        
+        target.currentEvent = internedEvent('do-nothing-event')
+        log.debug("entering async patternMatch, checkpoint is [%s]" % (checkPoint))
+        
+        # the output chunks are joined once the checkpoint is reached
+        chunks = []
+        while not (checkPoint (target) or target.currentEvent.isTimeout()):
+            
+            (patterns, compiled) = target.pattern_table(target.state, patternsExt)
+            searcher = target.alternation_searcher(target.state, patternsExt)
+            try:
+                log.debug("[%s] matching [%s]" % (target.state, patterns))
+                index = await self.expect(patterns, compiled, maxWaitTime, target.exactPatternMatch, searcher)
+                self.set_event(target, patterns, index, searcher)
+            except EOF:
+                log.debug("[%s] connection unexpectedly closed (%s)" % (target.name, self.pipe.before))
+                target.currentEvent = internedEvent('eof')
+            except TIMEOUT:
+                log.debug("[%s] connection timed out, unmatched output: [%s]" % (target.name, self.pipe.before))
+                target.currentEvent = internedEvent('timeout')
+
+            self.dispatch(target, chunks)
+            
+            # run the device operations requested by the actions
+            await target.flush()
+
+        return ''.join(chunks)
+
+    async def processResponse(self, target, checkPoint, patternsExt=[TIMEOUT]):
+        return await self.patternMatch(target, checkPoint, patternsExt, target.maxWait)
+
+
+
 # The source point of all paths        
 SOURCE_HOST = device('__source_host__')
 
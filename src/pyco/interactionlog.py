@@ -0,0 +1,144 @@
+'''
+The logs of the characters exchanged with the devices.
+
+The expect session writes everything it sends and receives into a log file object:
+the backends defined here bound the memory used by long lived sessions.
+
+ * `memory`: the whole interaction is kept in memory
+ * `ring`: only the last `size` characters are kept in memory
+ * `spill`: the interaction is kept in memory up to `size` characters, then it is moved to a temporary file
+ * `off`: nothing is kept
+
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import io #@UnresolvedImport
+import tempfile
+from collections import deque
+
+from pyco import log
+
+# create logger
+log = log.getLogger("interaction")
+
+
+class MemoryLog(io.StringIO):
+    '''
+    The whole interaction in memory
+    '''
+    def tail(self, size):
+        return self.getvalue()[-size:]
+
+
+class RingLog:
+    '''
+    The last `size` characters of the interaction
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.chunks = deque()
+        self.length = 0
+        self.closed = False
+
+    def write(self, s):
+        self.chunks.append(s)
+        self.length += len(s)
+        # drop the oldest chunks not needed for holding the last size characters
+        while len(self.chunks) > 1 and self.length - len(self.chunks[0]) >= self.size:
+            self.length -= len(self.chunks.popleft())
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed log.')
+        return ''.join(self.chunks)[-self.size:]
+
+    def tail(self, size):
+        return self.getvalue()[-size:]
+
+    def close(self):
+        self.chunks.clear()
+        self.closed = True
+
+
+class SpillLog:
+    '''
+    The whole interaction, moved from memory to a temporary file when it exceeds `size` characters
+    '''
+    def __init__(self, size):
+        self.file = tempfile.SpooledTemporaryFile(max_size=size, prefix='pyco-')
+
+    def write(self, s):
+        self.file.write(s.encode('utf-8'))
+
+    def flush(self):
+        self.file.flush()
+
+    def getvalue(self):
+        self.file.seek(0)
+        try:
+            return self.file.read().decode('utf-8', 'replace')
+        finally:
+            self.file.seek(0, io.SEEK_END)
+
+    def tail(self, size):
+        '''
+        Read only the end of the file: an utf-8 character is at most 4 bytes long
+        '''
+        end = self.file.seek(0, io.SEEK_END)
+        self.file.seek(max(0, end - size * 4))
+        try:
+            return self.file.read().decode('utf-8', 'replace')[-size:]
+        finally:
+            self.file.seek(0, io.SEEK_END)
+
+    @property
+    def spilled(self):
+        return self.file._rolled
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def close(self):
+        self.file.close()
+
+
+class NullLog:
+    '''
+    The interaction log is disabled
+    '''
+    closed = False
+
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''
+
+    def tail(self, size):
+        return ''
+
+    def close(self):
+        self.closed = True
+
+
+def interactionLog(mode='memory', size=65536):
+    '''
+    Return the interaction log object for the `mode` backend
+    '''
+    if mode == 'ring':
+        return RingLog(size)
+    elif mode == 'spill':
+        return SpillLog(size)
+    elif mode == 'off':
+        return NullLog()
+    elif mode != 'memory':
+        log.warning("unknown interactionLog [%s], using memory" % mode)
+    return MemoryLog()
@@ -7,12 +7,11 @@ import logging #@UnresolvedImport
 import logging.config #@UnresolvedImport
 import pyco
 import os
-from pkg_resources import resource_filename #@UnresolvedImport
 
 if hasattr(pyco, 'pyco_home') and os.path.isfile(pyco.pyco_home + "/cfg/log.cfg"):
     logfile = pyco.pyco_home + "/cfg/log.cfg"
 else:
-    logfile = resource_filename('pyco', 'cfg/log.cfg')
+    logfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cfg', 'log.cfg')
 try:    
     logging.config.fileConfig(logfile)
 except:
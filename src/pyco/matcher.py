@@ -0,0 +1,195 @@
+'''
+Pattern matchers used by the expect sessions.
+
+`Alternation` joins all the patterns of a FSM state into a single regular expression: every
+pattern becomes a named group of the alternation and the group name maps back to the event name.
+`AlternationSearcher` is the pexpect searcher matching an alternation.
+
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import re
+from pexpect import EOF, TIMEOUT #@UnresolvedImport
+
+# leading global flags of a pattern, for example (?i)
+globalFlags = re.compile(r'^\(\?([aiLmsux]+)\)')
+
+
+def scoped(pattern):
+    '''
+    Turn the leading global flags of pattern into flags scoped to the pattern itself,
+    so that the pattern may be embedded into an alternation::
+
+      >>> scoped('(?i)password:')
+      '(?i:password:)'
+      >>> scoped('login:')
+      'login:'
+    '''
+    match = globalFlags.match(pattern)
+    if match:
+        return '(?%s:%s)' % (match.group(1), pattern[match.end():])
+    return pattern
+
+
+# characters with a special meaning at the begin of a regular expression
+specials = '.^$*+?{}[]|()\\'
+
+# escaped characters standing for a control character
+controls = {'r': '\r', 'n': '\n', 't': '\t', 'f': '\f', 'v': '\v', 'a': '\a'}
+
+def first_chars(pattern):
+    '''
+    Return the set of characters a match of pattern may start with or None if the set
+    cannot be easily inferred from the pattern string::
+    
+      >>> sorted(first_chars('(?i)password:'))
+      ['P', 'p']
+      >>> sorted(first_chars('\\$ '))
+      ['$']
+      >>> first_chars('[Pp]assword') is None
+      True
+    '''
+    ignorecase = False
+    match = globalFlags.match(pattern)
+    if match:
+        ignorecase = 'i' in match.group(1)
+        pattern = pattern[match.end():]
+    
+    # an unescaped | may start a branch everywhere
+    if re.search(r'(?<!\\)\|', pattern):
+        return None
+
+    if pattern == '':
+        return None
+    elif pattern[0] == '\\' and len(pattern) > 1:
+        escaped = pattern[1]
+        if escaped in controls:
+            char = controls[escaped]
+        elif escaped.isalnum():
+            # a character class like \d
+            return None
+        else:
+            char = escaped
+        following = pattern[2:3]
+    elif pattern[0] in specials:
+        return None
+    else:
+        char = pattern[0]
+        following = pattern[1:2]
+    
+    # the first character is optional
+    if following != '' and following in '*?{':
+        return None
+    
+    if ignorecase:
+        return set([char.lower(), char.upper()])
+    return set([char])
+
+
+class Alternation:
+    '''
+    All the patterns of a state joined into a single compiled regular expression.
+
+    The alternation is immutable and it may be shared by the devices of a driver: the matches are
+    recorded by the :py:class:`AlternationSearcher` objects returned by :py:meth:`searcher`.
+    '''
+
+    def __init__(self, patterns, events):
+        '''
+        `patterns` is the list of regular expressions strings, pexpect.EOF or pexpect.TIMEOUT,
+        `events` is the list of the corresponding event names
+        '''
+        self.eof_index = -1
+        self.timeout_index = -1
+
+        # group name --> (pattern index, event name)
+        self.groups = {}
+        alternatives = []
+        for (n, (pattern, event)) in enumerate(zip(patterns, events)):
+            if pattern is EOF:
+                self.eof_index = n
+                continue
+            if pattern is TIMEOUT:
+                self.timeout_index = n
+                continue
+            name = 'p%d' % n
+            self.groups[name] = (n, event)
+            alternatives.append('(?P<%s>%s)' % (name, scoped(pattern)))
+
+        if alternatives:
+            alternation = '|'.join(alternatives)
+            
+            # a lookahead on the first character lets the regexp engine skip quickly
+            # the positions where no alternative may start
+            starts = set()
+            for pattern in patterns:
+                if pattern is EOF or pattern is TIMEOUT:
+                    continue
+                chars = first_chars(pattern)
+                if chars is None:
+                    starts = None
+                    break
+                starts |= chars
+            if starts:
+                alternation = '(?=[%s])(?:%s)' % (''.join([re.escape(c) for c in sorted(starts)]), alternation)
+                
+            self.regexp = re.compile(alternation, re.DOTALL)
+        else:
+            self.regexp = None
+
+    def searcher(self):
+        '''
+        Return a new searcher for an expect call
+        '''
+        return AlternationSearcher(alternation=self)
+
+
+class AlternationSearcher:
+    '''
+    A pexpect searcher matching all the patterns with one regular expression scan of the buffer.
+
+    The semantic is the same of the pexpect searcher_re: the earliest match in the buffer wins
+    and, for matches starting at the same position, the first pattern in the list wins.
+
+    After a successful search the `event` attribute is the name of the matched event: like the
+    pexpect searchers, a searcher keeps the state of the last search and it must not be shared
+    by concurrent expect calls.
+    '''
+
+    def __init__(self, patterns=None, events=None, alternation=None):
+        '''
+        Search the `alternation` or the :py:class:`Alternation` of `patterns` and `events`
+        '''
+        if alternation is None:
+            alternation = Alternation(patterns, events)
+        self.alternation = alternation
+        self.regexp = alternation.regexp
+        self.groups = alternation.groups
+        self.eof_index = alternation.eof_index
+        self.timeout_index = alternation.timeout_index
+        self.event = None
+
+    def __str__(self):
+        return 'AlternationSearcher: %s' % (self.regexp.pattern if self.regexp else None)
+
+    def search(self, buffer, freshlen, searchwindowsize=None):
+        '''
+        Search the buffer for the first match of the alternation. Return the index of the matched pattern
+        and set the attributes 'start', 'end', 'match' and 'event', otherwise return -1.
+        '''
+        if self.regexp is None:
+            return -1
+        if searchwindowsize is None:
+            searchstart = 0
+        else:
+            searchstart = max(0, len(buffer) - searchwindowsize)
+        match = self.regexp.search(buffer, searchstart)
+        if match is None:
+            return -1
+
+        self.match = match
+        self.start = match.start()
+        self.end = match.end()
+        (index, self.event) = self.groups[match.lastgroup]
+        return index
@@ -0,0 +1,149 @@
+'''
+The registry of the ``pyco.plugin`` authentication plugins.
+
+The plugins are the functions registered into the ``pyco.plugin`` entry point group: before connecting
+a device every plugin is called in turn with the device until one of them returns True, usually after
+setting the device credentials.
+
+The entry points are scanned and loaded only once, on the first connection: :py:func:`refresh` scans them
+again, for example after installing a new plugin. The attributes set on the device by the plugins may be
+cached per device for `pluginCacheTtl` seconds, so that a credential backend is not hit for every login.
+
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import time
+import threading
+
+from pyco import log
+
+# create logger
+log = log.getLogger("plugins")
+
+group = 'pyco.plugin'
+
+lock = threading.Lock()
+
+# the ordered list of (name, function), None until the entry points are scanned
+registry = None
+
+# (device name, protocol) --> (expire time, attributes set by the plugins)
+results = {}
+
+
+def entryPoints():
+    '''
+    Return the entry points of the plugin group in discovery order
+    '''
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        from pkg_resources import iter_entry_points #@UnresolvedImport
+        return list(iter_entry_points(group=group, name=None))
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=group))
+    return list(eps.get(group, []))
+
+
+def scan():
+    '''
+    Load the plugin functions: a plugin registered twice, for example by an egg-link and a wheel, is loaded once
+    '''
+    plugins = []
+    seen = set()
+    for ep in entryPoints():
+        ident = getattr(ep, 'value', None) or str(ep)
+        if ident in seen:
+            continue
+        seen.add(ident)
+        log.debug("found [%s] plugin [%s]" % (ep.name, ident))
+        try:
+            plugins.append((ep.name, ep.load()))
+        except Exception as e:
+            log.error("[%s] plugin not loaded: %s" % (ep.name, e))
+    return plugins
+
+
+def plugins():
+    '''
+    Return the ordered list of (name, function) plugins, scanning the entry points on the first call
+    '''
+    global registry
+    with lock:
+        if registry is None:
+            registry = scan()
+        return registry
+
+
+def refresh():
+    '''
+    Scan the entry points again and forget the cached plugin results
+    '''
+    global registry
+    with lock:
+        registry = scan()
+        results.clear()
+    return registry
+
+
+def register(name, function):
+    '''
+    Append a plugin not published as an entry point, the plugins scanned from the entry points come first
+    '''
+    current = plugins()
+    with lock:
+        current.append((name, function))
+
+
+def key(device):
+    return (device.name, device.protocol)
+
+
+def forget(device=None):
+    '''
+    Drop the cached plugin results of the device, or of all the devices
+    '''
+    with lock:
+        if device is None:
+            results.clear()
+        else:
+            results.pop(key(device), None)
+
+
+def authenticate(device):
+    '''
+    Call the plugins with the device until one returns True.
+
+    If the device `pluginCacheTtl` is greater than 0 the attributes set by the plugins are saved and,
+    for the following `pluginCacheTtl` seconds, they are set again without calling the plugins.
+    Return True if a plugin, or the cache, handled the device.
+    '''
+    ttl = device.pluginCacheTtl
+    if ttl:
+        k = key(device)
+        now = time.time()
+        with lock:
+            cached = results.get(k)
+        if cached is not None and cached[0] > now:
+            log.debug("[%s] using the cached plugin results" % device.name)
+            device.__dict__.update(cached[1])
+            return True
+
+    before = dict(device.__dict__)
+    for (name, function) in plugins():
+        if function(device):
+            log.debug("[%s] authenticated by [%s] plugin" % (device.name, name))
+            break
+    else:
+        return False
+
+    if ttl:
+        # only the attributes added or changed by the plugin are cached
+        changed = dict([(attr, value) for (attr, value) in device.__dict__.items()
+                        if attr not in before or before[attr] is not value])
+        with lock:
+            results[k] = (now + ttl, changed)
+    return True
@@ -0,0 +1,260 @@
+'''
+A pool of logged in device sessions.
+
+The pool hands out :py:class:`pyco.device.Device` objects already connected to the device, so that
+the login cost is paid only the first time a device url is requested::
+
+    pool = SessionPool(maxIdle=300, maxLifetime=3600, maxPerHost=2)
+
+    with pool.session('telnet://u:p@myhost/ciscoios') as h:
+        out = h('show version')
+
+The pool is thread safe: the sessions may be requested by the :py:class:`pyco.threadpool.ThreadPool` workers.
+
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import time
+import threading
+from contextlib import contextmanager
+
+from pyco.device import device, urlItems
+from pyco import log
+
+# create logger
+log = log.getLogger("pool")
+
+
+class PoolExhausted(Exception):
+    '''
+    Raised when no session to the host is released before the acquire timeout
+    '''
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class PooledSession:
+    '''
+    A device session with the pool timestamps
+    '''
+    def __init__(self, key, device):
+        self.key = key
+        self.device = device
+        self.created = time.time()
+        self.lastUsed = self.created
+
+
+class SessionPool:
+    '''
+    A thread safe pool of logged in devices keyed by the normalized device url.
+
+     * `maxIdle`: the seconds an unused session is kept open
+     * `maxLifetime`: the seconds after which a session is closed, even if it is healthy
+     * `maxPerHost`: the maximum number of sessions opened at the same time toward a host
+     * `healthCheck`: if True an idle session is checked sending an empty line and waiting for the prompt before handing it out
+     * `factory`: the function building the device from the url
+    '''
+
+    def __init__(self, maxIdle=300, maxLifetime=3600, maxPerHost=1, healthCheck=True, factory=device):
+        self.factory = factory
+        self.maxIdle = maxIdle
+        self.maxLifetime = maxLifetime
+        self.maxPerHost = maxPerHost
+        self.healthCheck = healthCheck
+
+        self.condition = threading.Condition()
+
+        # url key --> list of idle sessions, the most recently used last
+        self.idle = {}
+
+        # device --> session handed out
+        self.busy = {}
+
+        # host --> number of sessions opened
+        self.opened = {}
+
+        self.closed = False
+
+    @staticmethod
+    def key(url):
+        '''
+        The normalized url: the urls with the same items and default values share the sessions
+        '''
+        return urlItems(url)
+
+    def expired(self, session, now):
+        return now - session.created > self.maxLifetime or now - session.lastUsed > self.maxIdle
+
+    def acquire(self, url, timeout=None):
+        '''
+        Return a logged in device for the url.
+
+        If `maxPerHost` sessions toward the host are already handed out wait at most `timeout` seconds
+        for one of them to be released, then raise :py:exc:`pyco.pool.PoolExhausted`.
+        '''
+        key = self.key(url)
+        host = key[1]
+        deadline = None if timeout is None else time.time() + timeout
+
+        while True:
+            expired = []
+            try:
+                session = self.reserve(key, host, deadline, expired)
+            finally:
+                for e in expired:
+                    self.close_session(e)
+
+            if session is None:
+                # a new session slot was reserved for the host
+                log.debug("[%s] opening a new pooled session" % host)
+                try:
+                    h = self.factory(url)
+                    h.login()
+                except:
+                    self.forget(host)
+                    raise
+                session = PooledSession(key, h)
+
+            elif self.healthCheck and not self.is_healthy(session.device):
+                log.info("[%s] pooled session is not healthy, discarding it" % host)
+                self.discard(session)
+                continue
+
+            with self.condition:
+                self.busy[session.device] = session
+            return session.device
+
+    def reserve(self, key, host, deadline, expired):
+        '''
+        Take an idle session or reserve a new session slot for the host: return the session, or None for a
+        new slot. The expired sessions, whose slots are freed, are appended to the `expired` list for being closed.
+        '''
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise PoolExhausted('the session pool is closed')
+
+                now = time.time()
+                sessions = self.idle.get(key, [])
+                while sessions:
+                    session = sessions.pop()
+                    if self.expired(session, now):
+                        self.free(host)
+                        expired.append(session)
+                    else:
+                        return session
+
+                if self.opened.get(host, 0) < self.maxPerHost:
+                    self.opened[host] = self.opened.get(host, 0) + 1
+                    return None
+
+                # take the slot of an idle session opened toward the same host with another url
+                for (otherKey, others) in self.idle.items():
+                    if otherKey[1] == host and others:
+                        expired.append(others.pop(0))
+                        return None
+
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    timeLeft = deadline - now
+                    if timeLeft <= 0:
+                        raise PoolExhausted('%d sessions toward %s already in use' % (self.maxPerHost, host))
+                    self.condition.wait(timeLeft)
+
+    def is_healthy(self, h):
+        '''
+        Send an empty line and check that the device answers with the prompt
+        '''
+        try:
+            h.send_line('')
+            h.expect(lambda d: d.currentEvent.name == 'timeout' or d.currentEvent.name == 'prompt-match')
+            return h.currentEvent.name == 'prompt-match'
+        except Exception as e:
+            log.debug("[%s] health check failed: %s" % (h.name, e))
+            return False
+
+    def release(self, h, discard=False):
+        '''
+        Give back the device to the pool. If `discard` is True, or the device was closed, the session is closed.
+        '''
+        with self.condition:
+            session = self.busy.pop(h)
+            session.lastUsed = time.time()
+            if not (discard or self.closed or h.state == 'GROUND' or self.expired(session, session.lastUsed)):
+                self.idle.setdefault(session.key, []).append(session)
+                self.condition.notify_all()
+                return
+        self.discard(session)
+
+    @contextmanager
+    def session(self, url, timeout=None):
+        '''
+        A context manager acquiring and releasing the device: if the block raises an exception the
+        session is closed because the device state is unknown
+        '''
+        h = self.acquire(url, timeout)
+        try:
+            yield h
+        except:
+            self.release(h, discard=True)
+            raise
+        else:
+            self.release(h)
+
+    def discard(self, session):
+        '''
+        Close the session and free its host slot
+        '''
+        self.close_session(session)
+        self.forget(session.key[1])
+
+    def close_session(self, session):
+        log.debug("[%s] closing pooled session" % session.device.name)
+        try:
+            session.device.close()
+        except Exception as e:
+            log.debug("[%s] error closing pooled session: %s" % (session.device.name, e))
+
+    def free(self, host):
+        '''
+        Free a slot of the host, the caller holds the pool lock
+        '''
+        self.opened[host] -= 1
+        if self.opened[host] == 0:
+            del self.opened[host]
+        self.condition.notify_all()
+
+    def forget(self, host):
+        with self.condition:
+            self.free(host)
+
+    def prune(self):
+        '''
+        Close the expired idle sessions
+        '''
+        now = time.time()
+        discarded = []
+        with self.condition:
+            for sessions in self.idle.values():
+                for session in [s for s in sessions if self.expired(s, now)]:
+                    sessions.remove(session)
+                    discarded.append(session)
+        for session in discarded:
+            self.discard(session)
+
+    def close(self):
+        '''
+        Close the idle sessions: the sessions handed out are closed when released
+        '''
+        with self.condition:
+            self.closed = True
+            discarded = [s for sessions in self.idle.values() for s in sessions]
+            self.idle = {}
+            self.condition.notify_all()
+        for session in discarded:
+            self.discard(session)
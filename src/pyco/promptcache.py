@@ -0,0 +1,203 @@
+'''
+An in-process cache of the discovered prompts.
+
+The cache is a bounded LRU layered over the persistent prompt store: the lookups are served
+from memory and the discovered prompts are written behind in batches by a single writer thread,
+every `flushInterval` seconds and at exit, so that the store is not hit for every device.
+A batch that fails, for example because another process holds the database lock, is retried
+with the next batch.
+
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import time
+import atexit
+import threading
+from collections import OrderedDict
+
+from pyco import log
+
+# create logger
+log = log.getLogger("prompt-cache")
+
+
+class PromptCache:
+    '''
+    A thread safe LRU cache of the prompts keyed by (device name, state).
+
+     * `load`: the function reading a prompt from the store, ``load(device, state)`` returns the prompt or None
+     * `store`: the function writing a batch of prompts with a single transaction,
+       ``store(prompts, evicted)`` where `prompts` maps (device, state) to the prompt and `evicted` is the set
+       of the (device, state) keys to delete
+     * `maxSize`: the maximum number of prompts kept in memory
+     * `flushInterval`: the seconds the prompts wait before being written, 0 writes them immediately
+    '''
+
+    def __init__(self, load, store, maxSize=10000, flushInterval=5):
+        self.load = load
+        self.store = store
+        self.maxSize = maxSize
+        self.flushInterval = flushInterval
+
+        self.lock = threading.Lock()
+
+        # the batches are written in order
+        self.writing = threading.Lock()
+
+        # (device, state) --> prompt, the most recently used last: the prompts missing from the store are not
+        # cached because another process sharing the store may discover them
+        self.entries = OrderedDict()
+
+        # the writes not yet flushed to the store
+        self.dirty = {}
+        self.evicted = set()
+
+        self.writer = None
+        self.hits = 0
+        self.misses = 0
+
+        atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, device, state):
+        '''
+        Return the prompt of the device state or None
+        '''
+        key = (device, state)
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+            if key in self.dirty:
+                return self.dirty[key]
+            if key in self.evicted:
+                return None
+
+        try:
+            prompt = self.load(device, state)
+        except Exception as e:
+            log.debug('[%s] state [%s]: prompt store lookup failed: %s' % (device, state, e))
+            return None
+
+        with self.lock:
+            # a concurrent put wins over the stored value
+            if key not in self.entries:
+                if prompt is None:
+                    return None
+                self.entries[key] = prompt
+                self.trim()
+            return self.entries[key]
+
+    def put(self, device, state, prompt):
+        '''
+        Cache the prompt and schedule its write to the store
+        '''
+        key = (device, state)
+        with self.lock:
+            if key in self.entries and self.entries[key] == prompt:
+                self.entries.move_to_end(key)
+                return
+            self.entries[key] = prompt
+            self.entries.move_to_end(key)
+            self.trim()
+            self.dirty[key] = prompt
+            self.evicted.discard(key)
+        self.schedule()
+
+    def evict(self, device, state, prompt=None):
+        '''
+        Drop the stale prompt of the device state from the cache and from the store.
+        If `prompt` is defined the entry is evicted only if it still caches that prompt.
+        '''
+        key = (device, state)
+        with self.lock:
+            cached = self.dirty.get(key, self.entries.get(key))
+            if prompt is not None and cached is not None and cached != prompt:
+                return
+            log.debug('[%s] state [%s]: evicting cached prompt [%s]' % (device, state, cached))
+            self.entries.pop(key, None)
+            self.dirty.pop(key, None)
+            self.evicted.add(key)
+        self.schedule()
+
+    def warm(self, prompts):
+        '''
+        Fill the cache with the prompts read from the store, a dictionary (device, state) --> prompt:
+        the prompts waiting to be written are newer and they are not replaced
+        '''
+        with self.lock:
+            for (key, prompt) in prompts.items():
+                if key in self.dirty or key in self.evicted:
+                    continue
+                self.entries[key] = prompt
+                self.entries.move_to_end(key)
+            self.trim()
+
+    def trim(self):
+        '''
+        Drop the least recently used entries, the caller holds the lock
+        '''
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def schedule(self):
+        if self.flushInterval <= 0:
+            self.flush()
+            return
+        with self.lock:
+            if self.writer is not None:
+                return
+            self.writer = threading.Thread(target=self.write_behind, name='pyco-prompt-writer')
+            self.writer.daemon = True
+            self.writer.start()
+
+    def write_behind(self):
+        '''
+        The writer thread loop
+        '''
+        while True:
+            time.sleep(self.flushInterval)
+            self.flush()
+
+    def flush(self):
+        '''
+        Write the pending prompts to the store with a single transaction.
+        Return False if the store failed: the prompts are written again by the next flush.
+        '''
+        with self.writing:
+            with self.lock:
+                (prompts, evicted) = (self.dirty, self.evicted)
+                self.dirty = {}
+                self.evicted = set()
+
+            if not (prompts or evicted):
+                return True
+            log.debug('writing [%d] prompts, deleting [%d] prompts' % (len(prompts), len(evicted)))
+            try:
+                self.store(prompts, evicted)
+                return True
+            except Exception as e:
+                log.warning('prompts not saved, retrying with the next batch: %s' % e)
+
+            with self.lock:
+                # the changes arrived in the meantime are newer
+                for (key, prompt) in prompts.items():
+                    if key not in self.dirty and key not in self.evicted:
+                        self.dirty[key] = prompt
+                for key in evicted:
+                    if key not in self.dirty:
+                        self.evicted.add(key)
+            return False
+
+    def clear(self):
+        '''
+        Write the pending prompts and empty the cache
+        '''
+        self.flush()
+        with self.lock:
+            self.entries.clear()
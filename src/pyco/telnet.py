@@ -0,0 +1,165 @@
+'''
+A telnet client running inside the pyco process.
+
+`TelnetSpawn` connects a socket to the telnet server and exposes the same
+expect/sendline/before/after interface of a pexpect spawned child, so that the
+expect session drives it without forking an external ``telnet`` process.
+
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import socket
+from pexpect import EOF, TIMEOUT #@UnresolvedImport
+from pexpect.fdpexpect import fdspawn #@UnresolvedImport
+from pexpect.utils import select_ignore_interrupts #@UnresolvedImport
+
+from pyco import log
+
+# create logger
+log = log.getLogger("telnet")
+
+# telnet commands (RFC 854)
+SE   = 240
+SB   = 250
+WILL = 251
+WONT = 252
+DO   = 253
+DONT = 254
+IAC  = 255
+
+# telnet options
+ECHO = 1
+SGA  = 3
+
+# the server options accepted by the client, all the others are refused
+ACCEPTED_OPTIONS = (ECHO, SGA)
+
+# negotiation parser states
+DATA, COMMAND, OPTION, SUBNEGOTIATION, SUBNEGOTIATION_IAC = range(5)
+
+
+class TelnetSpawn(fdspawn):
+    '''
+    A pexpect spawn object connected to a telnet server through a socket.
+
+    The telnet options negotiation is performed while reading: the client accepts
+    the server ECHO and SUPPRESS-GO-AHEAD options and refuses all the others.
+    '''
+
+    def __init__(self, host, port=23, timeout=30, logfile=None, encoding='utf-8'):
+        self.socket = socket.create_connection((host, port), timeout)
+        fdspawn.__init__(self, self.socket, timeout=timeout, logfile=logfile, encoding=encoding)
+        self.name = '<telnet %s:%s>' % (host, port)
+
+        # NVT end of line
+        self.linesep = '\r\n'
+
+        self.parserState = DATA
+        self.negotiationCommand = None
+        self.lastByte = None
+
+    def negotiate(self, command, option):
+        '''
+        Answer to a server WILL/WONT/DO/DONT request
+        '''
+        if command == WILL:
+            reply = DO if option in ACCEPTED_OPTIONS else DONT
+        elif command == DO:
+            reply = WONT
+        else:
+            # WONT and DONT are acknowledgments that need no answer
+            return
+        log.debug("[%s] negotiation: [%d %d] -> [%d %d]" % (self.name, command, option, reply, option))
+        self.socket.sendall(bytes([IAC, reply, option]))
+
+    def filter(self, data):
+        '''
+        Remove the telnet commands from the received bytes and answer to the negotiation requests.
+
+        The parser state is kept across calls because a command may be splitted between two reads.
+        '''
+        out = bytearray()
+        for byte in data:
+            state = self.parserState
+            if state == DATA:
+                if byte == IAC:
+                    self.parserState = COMMAND
+                elif byte == 0 and self.lastByte == 13:
+                    # CR NUL is a bare carriage return
+                    pass
+                else:
+                    out.append(byte)
+                self.lastByte = byte
+            elif state == COMMAND:
+                if byte == IAC:
+                    # escaped 255 data byte
+                    out.append(byte)
+                    self.parserState = DATA
+                elif byte in (WILL, WONT, DO, DONT):
+                    self.negotiationCommand = byte
+                    self.parserState = OPTION
+                elif byte == SB:
+                    self.parserState = SUBNEGOTIATION
+                else:
+                    # NOP, GA and the other commands without option
+                    self.parserState = DATA
+            elif state == OPTION:
+                self.negotiate(self.negotiationCommand, byte)
+                self.parserState = DATA
+            elif state == SUBNEGOTIATION:
+                if byte == IAC:
+                    self.parserState = SUBNEGOTIATION_IAC
+            elif state == SUBNEGOTIATION_IAC:
+                self.parserState = DATA if byte == SE else SUBNEGOTIATION
+        return bytes(out)
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        '''
+        Read at most size characters from the telnet server
+        '''
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+        if timeout == -1:
+            timeout = self.timeout
+
+        rlist, _, _ = select_ignore_interrupts([self.child_fd], [], [], timeout)
+        if self.child_fd not in rlist:
+            raise TIMEOUT('Timeout exceeded.')
+
+        try:
+            data = self.socket.recv(size)
+        except socket.timeout:
+            return ''
+        except OSError as e:
+            self.flag_eof = True
+            raise EOF('connection closed: %s' % e)
+        if data == b'':
+            self.flag_eof = True
+            raise EOF('connection closed by the telnet server')
+
+        s = self._decoder.decode(self.filter(data), final=False)
+        self._log(s, 'read')
+        return s
+
+    def send(self, s):
+        '''
+        Send the string to the telnet server, doubling the IAC data bytes
+        '''
+        s = self._coerce_send_string(s)
+        self._log(s, 'send')
+
+        b = self._encoder.encode(s, final=False).replace(bytes([IAC]), bytes([IAC, IAC]))
+        self.socket.sendall(b)
+        return len(b)
+
+    def isalive(self):
+        return not self.closed and not self.flag_eof
+
+    def close(self, force=True):
+        if self.closed:
+            return
+        self.socket.close()
+        self.child_fd = -1
+        self.closed = True
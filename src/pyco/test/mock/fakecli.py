@@ -0,0 +1,95 @@
+'''
+A minimal unix-like command line interface used by the tests as the spawned child process.
+
+Usage: fakecli.py [password] [--echo] [--nologin]
+
+With --echo the terminal echo is disabled and the cli echoes every line when it reads it,
+like the network devices do: the lines typed ahead are echoed after the prompt.
+
+With --nologin the cli skips the login dialog, like a channel of an authenticated ssh master connection.
+
+The login dialog asks for the username and the password, then a ``$ `` prompt
+accepts the following commands:
+
+ * ``id``: a canned id response
+ * ``echo <text>``: print text without the quotes
+ * ``seq <n>``: print the numbers from 1 to n, one per line
+ * ``pager <n>``: pause the output every n lines with a ``--More--`` line, 0 disables the pager
+ * ``PS1='<prompt>'``: set the prompt
+ * ``exit``: close the session
+ * ``<python> fakecli.py ...``: run a nested fake cli, like a hop connecting to the next device of the path
+
+@author: adona
+'''
+import sys
+import subprocess
+
+def command(password='secret', echo=False, login=True):
+    '''
+    The command line that spawns the fake cli
+    '''
+    return '%s %s %s%s%s' % (sys.executable, __file__, password, ' --echo' if echo else '', '' if login else ' --nologin')
+
+def write(s):
+    sys.stdout.write(s)
+    sys.stdout.flush()
+
+def readline(echo=False):
+    line = sys.stdin.readline()
+    if not line:
+        sys.exit(0)
+    if echo:
+        write(line)
+    return line.strip()
+
+def main(password, echo=False, login=True):
+    if echo:
+        import termios
+        attrs = termios.tcgetattr(sys.stdin)
+        attrs[3] &= ~termios.ECHO
+        termios.tcsetattr(sys.stdin, termios.TCSANOW, attrs)
+
+    if login:
+        write('login: ')
+        readline(echo)
+        write('Password: ')
+        if readline() != password:
+            write('Login incorrect\r\n')
+            sys.exit(1)
+
+    write('Welcome to the fake cli\r\n')
+    prompt = '$ '
+    pager = 0
+    while True:
+        write(prompt)
+        line = readline(echo)
+        if line.startswith('PS1='):
+            prompt = line[4:].strip("'")
+        elif line == 'id':
+            write('uid=1000(pyco) gid=1000(pyco) groups=1000(pyco)\r\n')
+        elif line.startswith('echo '):
+            # like a shell remove the quotes
+            write(line[5:].replace('"', '').replace("'", '') + '\r\n')
+        elif line.startswith('seq '):
+            numbers = ['%d\r\n' % i for i in range(1, int(line[4:]) + 1)]
+            if pager:
+                for start in range(0, len(numbers), pager):
+                    if start:
+                        write('--More--')
+                        readline()
+                    write(''.join(numbers[start:start + pager]))
+            else:
+                write(''.join(numbers))
+        elif line.startswith('pager '):
+            pager = int(line[6:])
+        elif line.startswith(sys.executable + ' '):
+            subprocess.call(line.split())
+        elif line == 'exit':
+            write('logout\r\n')
+            break
+        elif line:
+            write('%s: command not found\r\n' % line)
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    main(args[0] if args else 'secret', '--echo' in sys.argv, '--nologin' not in sys.argv)
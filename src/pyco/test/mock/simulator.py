@@ -13,8 +13,9 @@ else:
     from winpexpect import TIMEOUT, EOF #@UnresolvedImport
     spawnFunction = 'winpexpect.winspawn'
 
-from mock import Mock, patch, patch_object, sentinel #@UnresolvedImport
+from mock import Mock #@UnresolvedImport
 from pyco import log
+from pyco.matcher import scoped
 
 # create logger
 log = log.getLogger("sim")
@@ -23,7 +24,7 @@ log = log.getLogger("sim")
 def responder(mock, responses, patterns, maxTime):
     
     log.debug('entering MOCK responder')
-    print(patterns)
+    log.debug("patterns: %s" % (patterns,))
 
     #return the index relative to event_name
     response = responses.pop(0)
@@ -33,7 +34,8 @@ def responder(mock, responses, patterns, maxTime):
     toBeMatched = True
     while toBeMatched and idx < len(patterns):
         
-        search = '(.*)(%s)' % patterns[idx]
+        pattern = getattr(patterns[idx], 'pattern', patterns[idx])
+        search = '(.*)(%s)' % (scoped(pattern) if isinstance(pattern, str) else pattern)
         log.debug("checking [%d] regexp: [%s]" % (idx, search))
         if patterns[idx] == TIMEOUT:
             
@@ -58,6 +60,23 @@ def responder(mock, responses, patterns, maxTime):
         mock.after = TIMEOUT
         raise TIMEOUT('wait time exceeded')
 
+def searcher_responder(mock, responses, searcher, maxTime):
+    
+    log.debug('entering MOCK searcher responder')
+    response = responses.pop(0)
+    
+    idx = searcher.search(response, len(response))
+    if idx >= 0:
+        mock.before = response[:searcher.start]
+        mock.after = response[searcher.start:searcher.end]
+        return idx
+    
+    mock.before = response
+    mock.after = TIMEOUT
+    if searcher.timeout_index >= 0:
+        return searcher.timeout_index
+    raise TIMEOUT('wait time exceeded')
+
 def side_effect(*args, **kwargs):
     
     m = Mock()
@@ -65,7 +84,12 @@ def side_effect(*args, **kwargs):
     def expect(patterns, timeout):
         return responder(m, side_effect.responses, patterns, timeout)
 
+    def expect_loop(searcher, timeout):
+        return searcher_responder(m, side_effect.responses, searcher, timeout)
+
     m.expect = expect
+    m.expect_list = expect
+    m.expect_loop = expect_loop
     
     # TODO: implements a exact match
     m.expect_exact = expect
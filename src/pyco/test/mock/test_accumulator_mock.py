@@ -0,0 +1,56 @@
+'''
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+from pyco.device import device
+from pyco.expectsession import ExpectSession
+
+import pyco.test.mock
+from . import simulator
+
+from mock import patch #@UnresolvedImport
+
+
+def paged_device(pages):
+    '''
+    A device in the USER_PROMPT state whose output is split into pages by a --More-- pager
+    '''
+    h = device('telnet://u:p@r-bo093')
+    h.state = 'USER_PROMPT'
+    h.add_expect_pattern('prompt-match', 'r-bo093#', 'USER_PROMPT')
+    h.add_event_action('more', pattern='--More--', action=lambda d: d.send_line(' '))
+
+    h.esession = ExpectSession([h], h)
+    h.esession.pipe = simulator.side_effect()
+    simulator.side_effect.responses = [page + '--More--' for page in pages[:-1]] + [pages[-1] + 'r-bo093#']
+    return h
+
+
+class Test(unittest.TestCase):
+
+    def testPagedOutput(self):
+        pages = ['line %d\r\n' % n * 100 for n in range(200)]
+        h = paged_device(pages)
+
+        out = h.esession.processResponse(h, lambda d: d.currentEvent.name == 'prompt-match')
+
+        self.assertEqual(out, '--More--'.join(pages))
+        self.assertEqual(h.esession.pipe.sendline.call_count, len(pages) - 1)
+
+    def testLeadingEmptyOutputs(self):
+        '''
+        The outputs of the script lines are newline separated, the leading empty outputs are skipped
+        '''
+        h = device('telnet://u:p@r-bo093')
+        h.state = 'USER_PROMPT'
+
+        outputs = {'a': '', 'b': 'x', 'c': '', 'd': 'y'}
+        with patch.object(h, 'process_single_line', side_effect=lambda line: outputs[line]):
+            self.assertEqual(h.send('a\nb\nc\nd'), 'x\n\ny')
+            self.assertEqual(h.send('a\nc'), '')
+
+
+if __name__ == "__main__":
+    unittest.main()
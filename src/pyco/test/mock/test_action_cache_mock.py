@@ -0,0 +1,64 @@
+'''
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+import sys
+
+import pyco.test.mock
+import pyco.device
+import pyco.actions
+from pyco.device import device, Driver, buildAction, get_callable, resolveCallable, EventHandlerUndefined
+
+from mock import patch, Mock #@UnresolvedImport
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        pyco.device.invalidate_actions()
+
+    def testResolvedOnce(self):
+        with patch.object(pyco.device, 'resolveCallable', wraps=resolveCallable) as resolver:
+            for n in range(10):
+                self.assertIs(get_callable('sendUsername'), pyco.actions.sendUsername)
+                self.assertIs(buildAction('sendPassword'), pyco.actions.sendPassword)
+        self.assertEqual(resolver.call_count, 2)
+
+    def testParameterizedAction(self):
+        with patch.object(pyco.device, 'resolveCallable', wraps=resolveCallable) as resolver:
+            action = buildAction(':send:yes:')
+            self.assertIs(buildAction(':send:yes:'), action)
+            self.assertIsNot(buildAction('send no'), action)
+        self.assertEqual(resolver.call_count, 1)
+
+        target = Mock()
+        action(target)
+        target.send_line.assert_called_with('yes')
+
+    def testUndefined(self):
+        with self.assertRaises(EventHandlerUndefined):
+            get_callable('undefinedAction')
+        self.assertNotIn('undefinedAction', pyco.device.resolvedActions)
+
+    def testSysPath(self):
+        '''
+        Building the devices does not grow sys.path
+        '''
+        device('ssh://localhost/linux')
+        size = len(sys.path)
+        for n in range(10):
+            Driver.compiled.clear()
+            pyco.device.invalidate_actions()
+            device('ssh://host%d/linux' % n)
+        self.assertEqual(len(sys.path), size)
+
+    def testInvalidatedOnReload(self):
+        get_callable('sendUsername')
+        pyco.device.install(pyco.device.configObj)
+        self.assertEqual(pyco.device.resolvedActions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+'''
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+
+import pyco.test.mock
+import pyco.device
+from pyco.device import device, Driver, CompiledFsm
+
+from mock import patch #@UnresolvedImport
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        Driver.compiled.clear()
+
+    def testCompiledOnce(self):
+        with patch.object(pyco.device, 'CompiledFsm', wraps=CompiledFsm) as compiler:
+            devices = [device('ssh://host%d/linux' % n) for n in range(20)]
+        self.assertEqual(compiler.call_count, 1)
+        for h in devices:
+            self.assertIs(h.state_transitions, devices[0].state_transitions)
+            self.assertIs(h.patternMap, devices[0].patternMap)
+
+    def testReadOnly(self):
+        h = device('ssh://localhost/linux')
+        with self.assertRaises(TypeError):
+            h.patternMap['*']['pattern'] = 'event'
+
+    def testCopyOnWrite(self):
+        h1 = device('ssh://host1/linux')
+        h2 = device('ssh://host2/linux')
+        patterns = dict(h2.patternMap['*'])
+
+        h1.add_expect_pattern('prompt-match', 'host1# ', 'USER_PROMPT')
+        h1.add_transition('my-event', 'USER_PROMPT', None, 'GROUND')
+
+        self.assertIsNone(h1.sharedFsm)
+        self.assertEqual(h1.patternMap['USER_PROMPT']['host1# '], 'prompt-match')
+        self.assertEqual(h1.get_transition('my-event', 'USER_PROMPT'), (None, 'GROUND'))
+
+        self.assertIsNotNone(h2.sharedFsm)
+        self.assertNotIn('USER_PROMPT', h2.patternMap)
+        self.assertEqual(dict(h2.patternMap['*']), patterns)
+        self.assertEqual(h2.get_transition('my-event', 'USER_PROMPT'), h2.default_transition)
+        self.assertEqual(dict(device('ssh://host3/linux').patternMap['*']), patterns)
+
+    def testPatternTableShared(self):
+        h1 = device('ssh://host1/linux')
+        h2 = device('ssh://host2/linux')
+        self.assertIs(h1.pattern_table('GROUND'), h2.pattern_table('GROUND'))
+
+    def testReload(self):
+        h1 = device('ssh://host1/linux')
+        pyco.device.install(pyco.device.configObj)
+        h2 = device('ssh://host2/linux')
+        self.assertIsNot(h1.sharedFsm, h2.sharedFsm)
+
+
+if __name__ == "__main__":
+    unittest.main()
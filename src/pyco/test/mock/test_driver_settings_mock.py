@@ -0,0 +1,56 @@
+'''
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+
+import pyco.test.mock
+from pyco.device import device, Driver, driverBuilder
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        # common <- linux <- mylinux
+        self.driver = driverBuilder('mylinux')
+        self.driver.parent = 'linux'
+
+    def tearDown(self):
+        del Driver.registry['mylinux']
+        Driver.flatten()
+        linux = Driver.get('linux')
+        if 'maxWait' in linux.__dict__:
+            del linux.maxWait
+
+    def testInherited(self):
+        h = device('ssh://localhost/mylinux')
+        self.assertEqual(h.maxWait, Driver.get('common').maxWait)
+        self.assertEqual(self.driver.settings['exitCommand'], 'exit')
+        self.assertFalse(hasattr(h, 'undefinedAttribute'))
+
+    def testParentNotInherited(self):
+        self.assertEqual(self.driver.parent, 'linux')
+        self.assertFalse(hasattr(Driver.get('common'), 'parent'))
+
+    def testParentChanged(self):
+        '''
+        The settings of the children are rebuilt when a driver attribute changes
+        '''
+        h = device('ssh://localhost/mylinux')
+        Driver.get('linux').maxWait = 42
+        self.assertEqual(h.maxWait, 42)
+        self.assertNotEqual(Driver.get('common').maxWait, 42)
+
+        del Driver.get('linux').maxWait
+        self.assertEqual(h.maxWait, Driver.get('common').maxWait)
+
+    def testDeviceOverride(self):
+        h = device('ssh://localhost/mylinux')
+        h.maxWait = 7
+        self.assertEqual(h.maxWait, 7)
+        self.assertEqual(device('ssh://localhost/mylinux').maxWait, Driver.get('common').maxWait)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+'''
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+
+import pyco.test.mock
+from pyco.device import device, Event, Prompt, symbol, symbols, internedEvent
+
+
+class Test(unittest.TestCase):
+
+    def testSlots(self):
+        with self.assertRaises(AttributeError):
+            Event('timeout').undefined = True
+        with self.assertRaises(AttributeError):
+            Prompt('$ ').undefined = True
+
+    def testInterned(self):
+        h = device('ssh://localhost/linux')
+        self.assertEqual(Event('username_event').id, symbols['username_event'])
+        self.assertEqual(symbol('username_event'), symbols['username_event'])
+
+        # the lines sent to the device are not interned
+        self.assertIsNone(Event('show version').id)
+        self.assertNotIn('show version', symbols)
+        self.assertEqual(h.get_transition('show version', 'USER_PROMPT'), h.default_transition)
+
+    def testTransitionById(self):
+        h = device('ssh://localhost/linux')
+        event = Event('symbols-test-event')
+        self.assertIsNone(event.id)
+
+        h.add_transition('symbols-test-event', 'USER_PROMPT', None, 'GROUND')
+        h.add_input_any('symbols-test-any', None, 'USER_PROMPT')
+
+        # an event created before its transition is found by name
+        h.state = 'USER_PROMPT'
+        self.assertTrue(h.process(event))
+        self.assertEqual(h.state, 'GROUND')
+
+        self.assertTrue(h.process(Event('symbols-test-any')))
+        self.assertEqual(h.state, 'USER_PROMPT')
+
+    def testSharedEvents(self):
+        self.assertIs(internedEvent('timeout'), internedEvent('timeout'))
+
+        # the propagation of the shared events is tracked by the device
+        h1 = device('ssh://host1/linux')
+        h2 = device('ssh://host2/linux')
+        h1.add_transition('symbols-test-shared', 'USER_PROMPT', None, 'GROUND')
+        h1.state = h2.state = 'USER_PROMPT'
+        h1.currentEvent = h2.currentEvent = internedEvent('symbols-test-shared')
+        h2.stopPropagation()
+        self.assertFalse(h2.process(h2.currentEvent))
+        self.assertTrue(h1.process(h1.currentEvent))
+        self.assertEqual(h1.state, 'GROUND')
+
+        # the current event is processed once
+        h1.state = 'USER_PROMPT'
+        self.assertFalse(h1.process(h1.currentEvent))
+        self.assertEqual(h1.state, 'USER_PROMPT')
+
+        h1.currentEvent = internedEvent('symbols-test-shared')
+        self.assertTrue(h1.process(h1.currentEvent))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+'''
+The import of pyco.device and pyco.expectsession does not load the optional dependencies not needed by the configuration.
+
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+import os
+import re
+import sys
+import shutil
+import tempfile
+import subprocess
+
+import pyco.test.mock
+from pyco.device import device, renderTemplate
+
+# the modules loaded only when used
+LAZY = ['sqlalchemy', 'zope.sqlalchemy', 'transaction', 'mako', 'pkg_resources', 'configobj', 'validate', 'asyncio']
+
+# the upper bound of the pyco.device and pyco.expectsession cumulative import time, in microseconds:
+# about 100 milliseconds on a development workstation
+MAX_IMPORT_TIME = 300000
+
+SCRIPT = '''
+import sys
+import pyco.device
+import pyco.expectsession
+print('loaded: ' + ' '.join([m for m in %r if m in sys.modules]))
+''' % LAZY
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        # a configuration without the prompt cache
+        self.home = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.home, 'cfg'))
+        shutil.copy(pyco.test.mock.cfgFile, os.path.join(self.home, 'cfg', 'pyco.cfg'))
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def importDevice(self, snapshots='1'):
+        '''
+        Import pyco.device and pyco.expectsession in a new interpreter, return the lazy modules loaded and the import time
+        '''
+        env = dict(os.environ, PYCO_HOME=self.home, PYCO_SNAPSHOTS=snapshots, PYTHONPATH=os.pathsep.join(sys.path))
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', SCRIPT], env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        importTime = sum([int(re.search(r'\|\s*(\d+) \| %s$' % module, result.stderr, re.MULTILINE).group(1))
+                          for module in ('pyco.device', 'pyco.expectsession')])
+        loaded = re.search(r'^loaded: (.*)$', result.stdout, re.MULTILINE).group(1)
+        return (loaded.split(), importTime)
+
+    def testImportTime(self):
+        # the first import parses the configuration and saves the snapshot
+        (loaded, _) = self.importDevice()
+        self.assertEqual(loaded, ['configobj', 'validate'])
+
+        (loaded, importTime) = self.importDevice()
+        self.assertEqual(loaded, [])
+        self.assertLess(importTime, MAX_IMPORT_TIME)
+
+    def testSnapshotsDisabled(self):
+        '''
+        Without PYCO_SNAPSHOTS the import does not write into PYCO_HOME
+        '''
+        for n in range(2):
+            (loaded, _) = self.importDevice(snapshots='')
+            self.assertEqual(loaded, ['configobj', 'validate'])
+        self.assertEqual(os.listdir(self.home), ['cfg'])
+
+    def testRenderTemplate(self):
+        h = device('ssh://pyco:secret@r1:2222')
+        self.assertEqual(renderTemplate(h.sshCommand, device=h), 'ssh pyco@r1')
+        self.assertEqual(renderTemplate('telnet ${ device.name } ${device.port}', device=h), 'telnet r1 2222')
+        self.assertEqual(renderTemplate('echo $HOME 100%', device=h), 'echo $HOME 100%')
+
+        # the mako syntax
+        self.assertEqual(renderTemplate('% for i in range(n):\nping ${i}\n% endfor\n', n=2), 'ping 0\nping 1\n')
+        self.assertEqual(renderTemplate('${n + 1}', n=1), '2')
+
+
+if __name__ == "__main__":
+    unittest.main()
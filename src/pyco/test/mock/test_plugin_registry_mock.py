@@ -0,0 +1,102 @@
+'''
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+
+import pyco.test.mock
+from pyco.device import device
+from pyco import plugins
+
+from mock import patch, Mock #@UnresolvedImport
+
+
+class EntryPoint:
+    def __init__(self, name, function):
+        self.name = name
+        self.value = 'vault:%s' % name
+        self.function = function
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.function
+
+
+def vault(device):
+    device.username = 'pyco'
+    device.password = 'secret'
+    return True
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.lookup = Mock(side_effect=vault)
+        self.eps = [EntryPoint('none', lambda d: False), EntryPoint('vault', self.lookup)]
+        self.patcher = patch.object(plugins, 'entryPoints', return_value=self.eps)
+        self.patcher.start()
+        plugins.refresh()
+
+    def tearDown(self):
+        self.patcher.stop()
+        plugins.registry = None
+        plugins.results.clear()
+
+    def testLoadedOnce(self):
+        for n in range(5):
+            h = device('ssh://localhost')
+            h.connect_command(h)
+        self.assertEqual([ep.loads for ep in self.eps], [1, 1])
+        self.assertEqual(self.lookup.call_count, 5)
+        self.assertEqual([name for (name, _) in plugins.plugins()], ['none', 'vault'])
+
+    def testRefresh(self):
+        plugins.plugins()
+        plugins.refresh()
+        self.assertEqual([ep.loads for ep in self.eps], [2, 2])
+
+    def testRegister(self):
+        plugins.register('last', lambda d: True)
+        self.assertEqual([name for (name, _) in plugins.plugins()], ['none', 'vault', 'last'])
+
+    def testCachedResults(self):
+        for n in range(3):
+            h = device('ssh://localhost')
+            h.pluginCacheTtl = 60
+            self.assertTrue(plugins.authenticate(h))
+            self.assertEqual((h.username, h.password), ('pyco', 'secret'))
+        self.assertEqual(self.lookup.call_count, 1)
+
+        # another device hits the backend
+        h = device('ssh://otherhost')
+        h.pluginCacheTtl = 60
+        plugins.authenticate(h)
+        self.assertEqual(self.lookup.call_count, 2)
+
+    def testExpiredResults(self):
+        h = device('ssh://localhost')
+        h.pluginCacheTtl = 60
+        plugins.authenticate(h)
+        with patch('time.time', return_value=plugins.results[plugins.key(h)][0] + 1):
+            plugins.authenticate(h)
+        self.assertEqual(self.lookup.call_count, 2)
+
+    def testForget(self):
+        h = device('ssh://localhost')
+        h.pluginCacheTtl = 60
+        plugins.authenticate(h)
+        plugins.forget(h)
+        plugins.authenticate(h)
+        self.assertEqual(self.lookup.call_count, 2)
+
+    def testNoCacheByDefault(self):
+        for n in range(3):
+            plugins.authenticate(device('ssh://localhost'))
+        self.assertEqual(self.lookup.call_count, 3)
+        self.assertEqual(plugins.results, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+'''
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+import threading
+
+import pyco.test.mock
+from pyco.promptcache import PromptCache
+
+
+class Store:
+    '''
+    A prompt store counting the accesses
+    '''
+    def __init__(self, prompts={}):
+        self.prompts = dict(prompts)
+        self.loads = 0
+        self.transactions = 0
+        self.flushed = threading.Event()
+
+    def load(self, device, state):
+        self.loads += 1
+        return self.prompts.get((device, state))
+
+    def store(self, prompts, evicted):
+        self.transactions += 1
+        self.prompts.update(prompts)
+        for key in evicted:
+            self.prompts.pop(key, None)
+        self.flushed.set()
+
+
+class Test(unittest.TestCase):
+
+    def testLookups(self):
+        store = Store({('r1', 'USER_PROMPT'): 'r1>'})
+        cache = PromptCache(store.load, store.store, flushInterval=0)
+
+        for _ in range(100):
+            self.assertEqual(cache.get('r1', 'USER_PROMPT'), 'r1>')
+            # the missing prompts are not cached, another process may discover them
+            self.assertEqual(cache.get('r2', 'USER_PROMPT'), None)
+        self.assertEqual(store.loads, 101)
+        self.assertEqual(cache.hits, 99)
+
+        store.prompts[('r2', 'USER_PROMPT')] = 'r2>'
+        self.assertEqual(cache.get('r2', 'USER_PROMPT'), 'r2>')
+
+    def testBounded(self):
+        store = Store()
+        cache = PromptCache(store.load, store.store, maxSize=10, flushInterval=0)
+        for n in range(100):
+            cache.put('r%d' % n, 'USER_PROMPT', 'r%d>' % n)
+        self.assertEqual(len(cache), 10)
+
+        # the least recently used prompts are read again from the store
+        self.assertEqual(cache.get('r0', 'USER_PROMPT'), 'r0>')
+        self.assertEqual(store.loads, 1)
+
+    def testWriteBehind(self):
+        store = Store()
+        cache = PromptCache(store.load, store.store, flushInterval=60)
+        for n in range(100):
+            cache.put('r%d' % n, 'USER_PROMPT', 'r%d>' % n)
+            # the same prompt is not written again
+            cache.put('r%d' % n, 'USER_PROMPT', 'r%d>' % n)
+        self.assertEqual(store.transactions, 0)
+        self.assertEqual(cache.get('r50', 'USER_PROMPT'), 'r50>')
+
+        cache.flush()
+        self.assertEqual(store.transactions, 1)
+        self.assertEqual(len(store.prompts), 100)
+
+        cache.flush()
+        self.assertEqual(store.transactions, 1)
+
+    def testPeriodicFlush(self):
+        store = Store()
+        cache = PromptCache(store.load, store.store, flushInterval=0.1)
+
+        cache.put('r1', 'USER_PROMPT', 'r1>')
+        cache.put('r2', 'USER_PROMPT', 'r2>')
+        self.assertTrue(store.flushed.wait(5))
+        self.assertEqual(store.transactions, 1)
+        self.assertEqual(store.prompts, {('r1', 'USER_PROMPT'): 'r1>', ('r2', 'USER_PROMPT'): 'r2>'})
+
+    def testEvict(self):
+        store = Store({('r1', 'USER_PROMPT'): 'r1>'})
+        cache = PromptCache(store.load, store.store, flushInterval=60)
+
+        # the discovery found another prompt: the entry is not stale
+        cache.put('r1', 'USER_PROMPT', 'r1#')
+        cache.evict('r1', 'USER_PROMPT', 'r1>')
+        self.assertEqual(cache.get('r1', 'USER_PROMPT'), 'r1#')
+
+        cache.evict('r1', 'USER_PROMPT', 'r1#')
+        self.assertEqual(cache.get('r1', 'USER_PROMPT'), None)
+        cache.flush()
+        self.assertEqual(store.prompts, {})
+        self.assertEqual(store.loads, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+'''
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+import os
+import tempfile
+
+import pyco.test.mock
+import pyco.device
+from pyco import cachetool
+
+from mock import patch #@UnresolvedImport
+
+PROMPTS = {('r1', 'USER_PROMPT'): 'r1>', ('r1', 'ENABLE_PROMPT'): 'r1#', ('r2', 'USER_PROMPT'): 'r2>'}
+
+
+@unittest.skipUnless(pyco.device.sql_powered, 'sqlalchemy not installed')
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        # the test caches replace the configured one
+        self.patcher = patch.multiple(pyco.device, create=True, engine=None, DBSession=None, promptCache=None)
+        self.patcher.start()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp.cleanup()
+
+    def db(self, name):
+        return 'sqlite:///%s' % os.path.join(self.tmp.name, name)
+
+    def fill(self):
+        pyco.device.open_cache(self.db('node1.sqlite'))
+        for ((name, state), prompt) in PROMPTS.items():
+            pyco.device.promptCache.put(name, state, prompt)
+        pyco.device.promptCache.flush()
+
+    def testExportImport(self):
+        self.fill()
+        dump = os.path.join(self.tmp.name, 'prompts.json.gz')
+        self.assertEqual(pyco.device.export_prompts(dump), 3)
+
+        pyco.device.open_cache(self.db('node2.sqlite'))
+        self.assertEqual(pyco.device.import_prompts(dump), 3)
+
+        pyco.device.promptCache.clear()
+        self.assertEqual(pyco.device.promptCache.get('r1', 'ENABLE_PROMPT'), 'r1#')
+
+    def testPreload(self):
+        self.fill()
+        pyco.device.promptCache.clear()
+
+        self.assertEqual(pyco.device.preload_prompts(['r1', 'r2', 'r3']), 3)
+        with patch.object(pyco.device.promptCache, 'load', side_effect=AssertionError('store lookup')):
+            for ((name, state), prompt) in PROMPTS.items():
+                self.assertEqual(pyco.device.promptCache.get(name, state), prompt)
+
+    def testCli(self):
+        self.fill()
+        dump = os.path.join(self.tmp.name, 'prompts.json')
+        self.assertEqual(cachetool.main(['--db', self.db('node1.sqlite'), 'export', dump]), 0)
+        self.assertEqual(cachetool.main(['--db', self.db('node2.sqlite'), 'import', dump]), 0)
+        with open(dump) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+'''
+Created on Oct 17, 2026
+
+@author: adona
+'''
+import unittest #@UnresolvedImport
+import os
+import shutil
+import tempfile
+
+import pyco.test.mock
+import pyco.device
+from pyco.device import Driver
+
+from mock import patch #@UnresolvedImport
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cfgFile = os.path.join(self.tmp, 'pyco.cfg')
+        shutil.copy(pyco.test.mock.cfgFile, self.cfgFile)
+        self.patchers = [patch.object(pyco.device, 'snapshotDir', os.path.join(self.tmp, 'snapshots')),
+                         patch.object(pyco.device, 'snapshotsEnabled', True)]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        pyco.device.loadConfiguration(pyco.test.mock.cfgFile)
+        shutil.rmtree(self.tmp)
+
+    def testSnapshot(self):
+        config = pyco.device.loadConfiguration(self.cfgFile)
+        self.assertEqual(len(os.listdir(pyco.device.snapshotDir)), 1)
+
+        # the snapshot is installed without parsing the configuration file
+        with patch('configobj.ConfigObj', side_effect=AssertionError('configuration parsed')):
+            pyco.device.installConfiguration(self.cfgFile)
+        self.assertEqual(pyco.device.configObj, config.dict())
+        self.assertEqual(Driver.get('linux').maxWait, Driver.get('common').maxWait)
+        self.assertEqual(list(pyco.device.configObj['common']['events']), list(config['common']['events']))
+
+        # loadConfiguration always returns a ConfigObj
+        self.assertIs(type(pyco.device.loadConfiguration(self.cfgFile)), type(config))
+
+        # a changed configuration file is parsed again
+        with open(self.cfgFile, 'a') as cfg:
+            cfg.write('\n[mydriver]\nparent = common\nexitCommand = logout\n')
+        pyco.device.installConfiguration(self.cfgFile)
+        self.assertEqual(Driver.get('mydriver').exitCommand, 'logout')
+
+        # the superseded snapshot is removed
+        self.assertEqual(len(os.listdir(pyco.device.snapshotDir)), 1)
+
+    def testDisabled(self):
+        '''
+        Without PYCO_SNAPSHOTS no snapshot is written or read
+        '''
+        with patch.object(pyco.device, 'snapshotsEnabled', False):
+            pyco.device.installConfiguration(self.cfgFile)
+            pyco.device.loadConfiguration(self.cfgFile)
+        self.assertFalse(os.path.exists(pyco.device.snapshotDir))
+
+    def testOtherFiles(self):
+        '''
+        The snapshots of the other configuration files are kept
+        '''
+        otherFile = os.path.join(self.tmp, 'other.cfg')
+        shutil.copy(self.cfgFile, otherFile)
+        pyco.device.loadConfiguration(self.cfgFile)
+        pyco.device.loadConfiguration(otherFile)
+        with open(otherFile, 'a') as cfg:
+            cfg.write('\n[mydriver]\nparent = common\n')
+        pyco.device.loadConfiguration(otherFile)
+
+        snapshots = os.listdir(pyco.device.snapshotDir)
+        self.assertEqual(len(snapshots), 2)
+        self.assertIn(os.path.basename(pyco.device.snapshotPath(self.cfgFile)), snapshots)
+        self.assertIn(os.path.basename(pyco.device.snapshotPath(otherFile)), snapshots)
+
+    def testCorrupted(self):
+        pyco.device.loadConfiguration(self.cfgFile)
+        for f in os.listdir(pyco.device.snapshotDir):
+            with open(os.path.join(pyco.device.snapshotDir, f), 'wb') as snapshot:
+                snapshot.write(b'corrupted')
+
+        pyco.device.installConfiguration(self.cfgFile)
+        self.assertEqual(pyco.device.configObj['common']['maxWait'], Driver.get('common').maxWait)
+
+
+if __name__ == "__main__":
+    unittest.main()